@@ -1,10 +1,18 @@
 from fastapi import FastAPI, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
 import uuid
+import asyncio
 import logging
 import uvicorn
 from contextlib import asynccontextmanager
+from typing import Any, List, Optional
+from pydantic import BaseModel, Field
 from service.service import DomainSanitizerService
+from opensearch_client import get_opensearch_client_async, close_opensearch_client
+from whoare.scrap import whois_web, dondominio
+from service.ascii_cctld_service import clear_ascii_cctld_cache
+from service.ascii_geotld_service import clear_ascii_geotld_cache
+from service.idn_cctld_service import clear_idn_cctld_cache
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -13,25 +21,84 @@ logger.debug("DEBUG TEST: logging está activo")
 print("PRINT TEST: stdout está activo")
 
 
+# Modelo de respuesta de /validate: FastAPI lo serializa con el serializador compilado de pydantic
+class ValidateResponse(BaseModel):
+    request_id: str
+    email: str
+    veredict: str = "valid"
+    veredict_detail: Optional[str] = None
+    company_impersonated: Optional[str] = None
+    company_detected: Optional[str] = None
+    confidence: float = 1.0
+    labels: List[str] = []
+    evidences: List[Any] = []
+
+
+# Tope de emails por petición a /validate/batch: cada uno puede acabar en varias consultas WHOIS
+MAX_BATCH_EMAILS = 100
+
+
+# Cuerpo de /validate/batch: lista de strings acotada (fuera de tipo o por encima del tope → 422)
+class ValidateBatchRequest(BaseModel):
+    emails: List[str] = Field(..., max_length=MAX_BATCH_EMAILS)
+
+
+def _to_validate_response(email: str, sanitized_result: dict) -> ValidateResponse:
+    # Aquí debes mapear sanitized_result a los campos esperados
+    return ValidateResponse(
+        request_id=str(uuid.uuid4()),
+        email=email,
+        veredict=sanitized_result.get("veredict", "valid"),  # Ajusta según tu lógica
+        veredict_detail=sanitized_result.get("veredict_detail", None),
+        company_impersonated=sanitized_result.get("company_impersonated", None),
+        company_detected=sanitized_result.get("company_detected", None),
+        confidence=sanitized_result.get("confidence", 1.0),
+        labels=sanitized_result.get("labels", []),
+        evidences=sanitized_result.get("evidences", [])
+    )
+
+
 # 1. Definición del Ciclo de Vida (Lifespan)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # --- Lógica de STARTUP (Inicio) ---
     logger.info("Iniciando aplicación: Verificando índices de OpenSearch...")
+    # El cliente OpenSearch del proceso se crea aquí sin bloquear el event loop
+    # y lo reutilizan todas las peticiones
     try:
-        # Llamamos a tus métodos de inicialización
-        DomainSanitizerService.ensure_mail_names_index()
-        DomainSanitizerService.ensure_omit_words_index()
-        DomainSanitizerService.ensure_known_brands_index()
-        DomainSanitizerService.ensure_privacy_values_index()
-        logger.info("Índices verificados con éxito.")
+        app.state.opensearch = await get_opensearch_client_async()
     except Exception as e:
+        logger.error(f"No se pudo conectar con OpenSearch durante el arranque: {e}")
+
+    # Llamamos a tus métodos de inicialización en paralelo (son independientes entre sí)
+    ensure_fns = [
+        DomainSanitizerService.ensure_mail_names_index,
+        DomainSanitizerService.ensure_omit_words_index,
+        DomainSanitizerService.ensure_known_brands_index,
+        DomainSanitizerService.ensure_privacy_values_index,
+    ]
+    results = await asyncio.gather(
+        *(asyncio.to_thread(fn) for fn in ensure_fns),
+        return_exceptions=True
+    )
+    errors = [r for r in results if isinstance(r, Exception)]
+    for e in errors:
         logger.error(f"Error crítico durante la inicialización de índices: {e}")
+    if not errors:
+        logger.info("Índices verificados con éxito.")
+        # omit_words + privacy_values en una sola petición, antes de la primera request
+        try:
+            await asyncio.to_thread(DomainSanitizerService.preload_reference_data)
+        except Exception as e:
+            logger.error(f"No se pudieron precargar los datos de referencia: {e}")
     
     yield # Aquí es donde la aplicación "corre"
     
     # --- Lógica de SHUTDOWN (Cierre) ---
     logger.info("Cerrando aplicación...")
+    await whois_web.aclose_client()
+    await dondominio.aclose_api()
+    close_opensearch_client()
 
 # 2. Inicialización de FastAPI con lifespan
 app = FastAPI(title="Domain Sanitizer API", lifespan=lifespan)
@@ -43,7 +110,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post('/validate')
+@app.post('/validate', response_model=ValidateResponse)
 async def validate(data: dict = Body(...)):
     email = data.get('email')
     if not email:
@@ -54,23 +121,44 @@ async def validate(data: dict = Body(...)):
         sanitized_result = await DomainSanitizerService.sanitize_mail(email)
         logger.debug(f"Resultado obtenido para {email}: \n {sanitized_result}")
 
-        # Aquí debes mapear sanitized_result a los campos esperados
-        return {
-            "request_id": str(uuid.uuid4()),
-            "email": email,
-            "veredict": sanitized_result.get("veredict", "valid"),  # Ajusta según tu lógica
-            "veredict_detail": sanitized_result.get("veredict_detail", None),
-            "company_impersonated": sanitized_result.get("company_impersonated", None),
-            "company_detected": sanitized_result.get("company_detected", None),
-            "confidence": sanitized_result.get("confidence", 1.0),
-            "labels": sanitized_result.get("labels", []),
-            "evidences": sanitized_result.get("evidences", [])
-        }
+        return _to_validate_response(email, sanitized_result)
     
     except Exception as e:
         logger.error(f"Error crítico procesando {email}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal processing error")
 
+@app.post('/validate/batch', response_model=List[ValidateResponse])
+async def validate_batch(data: ValidateBatchRequest):
+    emails = data.emails
+    if not emails:
+        raise HTTPException(status_code=400, detail="No emails provided")
+
+    # Varios emails en paralelo (acotado) en vez de una petición /validate por email
+    results = await DomainSanitizerService.sanitize_mails(emails)
+
+    responses = []
+    for email, result in zip(emails, results):
+        if isinstance(result, BaseException):
+            # Un email que falla no tumba el lote: se marca y se sigue
+            logger.error(f"Error crítico procesando {email}: {str(result)}", exc_info=result)
+            responses.append(ValidateResponse(
+                request_id=str(uuid.uuid4()),
+                email=email,
+                veredict="error",
+                veredict_detail="Internal processing error",
+                confidence=0.0
+            ))
+        else:
+            responses.append(_to_validate_response(email, result))
+    return responses
+
+@app.post('/admin/reload-tlds')
+async def reload_tlds():
+    # Invalida la caché de TLDs: la siguiente petición vuelve a leerlos de OpenSearch
+    clear_ascii_cctld_cache()
+    clear_ascii_geotld_cache()
+    clear_idn_cctld_cache()
+    return {"status": "ok"}
+
 if __name__ == '__main__':
-    # Uvicorn es el servidor ASGI equivalente a Waitress
     uvicorn.run(app, host='0.0.0.0', port=8000)
@@ -1,46 +1,281 @@
 import os
 import time
+import asyncio
 import logging
-from opensearchpy import OpenSearch
+import threading
+from contextlib import contextmanager
+import orjson
+from typing import Dict, Iterator, Optional, Tuple
+from opensearchpy import OpenSearch, Urllib3HttpConnection
+from opensearchpy.exceptions import RequestError, SerializationError
+from opensearchpy.serializer import JSONSerializer
+from opensearchpy.helpers import scan
 
 logger = logging.getLogger(__name__)
 
-def get_opensearch_client(retries: int = None, backoff_seconds: int = None) -> OpenSearch:
-    """Return an OpenSearch client and wait for the cluster to be reachable.
+class OrjsonSerializer(JSONSerializer):
+    """JSON (de)serializer backed by orjson: much faster parsing of large hit lists."""
+
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data):
+        # strings are passed through untouched, same as JSONSerializer
+        if isinstance(data, str):
+            return data
+        try:
+            return orjson.dumps(data, default=self.default).decode("utf-8")
+        except (TypeError, orjson.JSONEncodeError) as e:
+            raise SerializationError(data, e)
 
-    Retries and backoff can be configured via env vars:
-      OPENSEARCH_WAIT_RETRIES (default 12)
-      OPENSEARCH_WAIT_BACKOFF (default 2)
-    """
-    host = os.getenv("OPENSEARCH_HOST", "opensearch")
-    port = int(os.getenv("OPENSEARCH_PORT", "9200"))
 
+def _wait_settings(retries: Optional[int], backoff_seconds: Optional[float]):
     retries = retries if retries is not None else int(os.getenv("OPENSEARCH_WAIT_RETRIES", "12"))
-    backoff_seconds = backoff_seconds if backoff_seconds is not None else int(os.getenv("OPENSEARCH_WAIT_BACKOFF", "2"))
+    backoff_seconds = backoff_seconds if backoff_seconds is not None else float(os.getenv("OPENSEARCH_WAIT_BACKOFF", "0.25"))
+    max_sleep = float(os.getenv("OPENSEARCH_WAIT_MAX_SLEEP", "8"))
+    return retries, backoff_seconds, max_sleep
 
-    client = OpenSearch(
+
+def _new_client(http_compress: bool = False) -> OpenSearch:
+    host = os.getenv("OPENSEARCH_HOST", "opensearch")
+    port = int(os.getenv("OPENSEARCH_PORT", "9200"))
+    timeout = float(os.getenv("OPENSEARCH_TIMEOUT", "10"))
+    max_retries = int(os.getenv("OPENSEARCH_MAX_RETRIES", "3"))
+    # Ask for gzipped responses without compressing requests: pays off when the
+    # cluster is remote and hit lists are large (urllib3 decompresses transparently)
+    headers = {}
+    if os.getenv("OPENSEARCH_GZIP_RESPONSES", "0") == "1":
+        headers["accept-encoding"] = "gzip,deflate"
+
+    return OpenSearch(
         hosts=[{"host": host, "port": port}],
-        http_compress=True,
+        # The service talks to OpenSearch over the local network with small bodies:
+        # gzip costs more CPU than it saves in bytes (bulk loads use their own client)
+        http_compress=http_compress,
         use_ssl=False,
         verify_certs=False,
         ssl_show_warn=False,
+        # Keep-alive pool shared process-wide (see get_opensearch_client_cached)
+        connection_class=Urllib3HttpConnection,
+        serializer=OrjsonSerializer(),
+        pool_maxsize=32,
+        headers=headers,
+        timeout=timeout,
+        max_retries=max_retries,
+        retry_on_timeout=True,
     )
 
+
+def _check_health(client: OpenSearch) -> None:
+    """Raise unless the cluster reaches at least yellow status."""
+    # The cluster waits server-side (up to 5s) for a usable state, so a
+    # cluster that recovers between polls costs no extra round-trips
+    timeout = float(os.getenv("OPENSEARCH_TIMEOUT", "10"))
+    health = client.cluster.health(wait_for_status="yellow", timeout="5s", request_timeout=timeout + 5)
+    if health.get("timed_out"):
+        raise RuntimeError(f"OpenSearch cluster status is {health.get('status')}")
+
+
+def get_opensearch_client(retries: int = None, backoff_seconds: float = None) -> OpenSearch:
+    """Return an OpenSearch client and wait for the cluster to be reachable.
+
+    The wait between attempts grows exponentially (backoff, 2*backoff, 4*backoff...)
+    up to a cap. Retries and backoff can be configured via env vars:
+      OPENSEARCH_WAIT_RETRIES (default 12)
+      OPENSEARCH_WAIT_BACKOFF (default 0.25)
+      OPENSEARCH_WAIT_MAX_SLEEP (default 8)
+    Per-request timeout (seconds) comes from OPENSEARCH_TIMEOUT (default 10) and
+    transport retries from OPENSEARCH_MAX_RETRIES (default 3); set
+    OPENSEARCH_GZIP_RESPONSES=1 to request gzipped responses.
+
+    Blocks the calling thread while waiting: from async code use
+    get_opensearch_client_async instead.
+    """
+    retries, backoff_seconds, max_sleep = _wait_settings(retries, backoff_seconds)
+    client = _new_client()
+
     attempt = 0
     while True:
         try:
             attempt += 1
-            logger.debug(f"Pinging OpenSearch (attempt {attempt}/{retries}) at {host}:{port}")
-            if client.ping():
-                logger.info("Connected to OpenSearch")
-                return client
-            else:
-                raise RuntimeError("OpenSearch ping returned False")
+            logger.debug(f"Waiting for OpenSearch (attempt {attempt}/{retries})")
+            _check_health(client)
+            logger.info("Connected to OpenSearch")
+            return client
         except Exception as exc:
             logger.warning(f"OpenSearch not available yet: {exc}")
             if attempt >= retries:
                 logger.error(f"Could not connect to OpenSearch after {retries} attempts")
                 raise
-            sleep_time = backoff_seconds * attempt
+            sleep_time = min(max_sleep, backoff_seconds * (2 ** (attempt - 1)))
             time.sleep(sleep_time)
 
+
+async def _wait_for_client_async(retries: int = None, backoff_seconds: float = None) -> OpenSearch:
+    """Async twin of get_opensearch_client: never blocks the event loop."""
+    retries, backoff_seconds, max_sleep = _wait_settings(retries, backoff_seconds)
+    client = _new_client()
+
+    attempt = 0
+    while True:
+        try:
+            attempt += 1
+            logger.debug(f"Waiting for OpenSearch (attempt {attempt}/{retries})")
+            await asyncio.to_thread(_check_health, client)
+            logger.info("Connected to OpenSearch")
+            return client
+        except Exception as exc:
+            logger.warning(f"OpenSearch not available yet: {exc}")
+            if attempt >= retries:
+                logger.error(f"Could not connect to OpenSearch after {retries} attempts")
+                raise
+            sleep_time = min(max_sleep, backoff_seconds * (2 ** (attempt - 1)))
+            await asyncio.sleep(sleep_time)
+
+
+_CLIENT: Optional[OpenSearch] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_opensearch_client_cached() -> OpenSearch:
+    """Return the process-wide OpenSearch client.
+
+    The client is built (and the cluster health checked) only on the first call;
+    later calls reuse the same instance and its connection pool (pool_maxsize=32).
+    The client is thread-safe, so it can be shared by concurrent requests and
+    asyncio.to_thread workers.
+    """
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = get_opensearch_client()
+    return _CLIENT
+
+
+async def get_opensearch_client_async() -> OpenSearch:
+    """Return the process-wide OpenSearch client, waiting with asyncio.sleep.
+
+    Shares the same instance as get_opensearch_client_cached.
+    """
+    global _CLIENT
+    if _CLIENT is None:
+        client = await _wait_for_client_async()
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = client
+            else:
+                client.close()
+    return _CLIENT
+
+
+_BULK_CLIENT: Optional[OpenSearch] = None
+
+
+def get_opensearch_bulk_client() -> OpenSearch:
+    """Return the process-wide client used for _bulk loads.
+
+    Same settings as get_opensearch_client_cached but with http_compress=True:
+    bulk bodies are large and repetitive, so gzip pays off there while it
+    would only add CPU to the small get/search requests.
+    """
+    global _BULK_CLIENT
+    if _BULK_CLIENT is None:
+        # The shared client waits for the cluster, so no extra health check here
+        get_opensearch_client_cached()
+        with _CLIENT_LOCK:
+            if _BULK_CLIENT is None:
+                _BULK_CLIENT = _new_client(http_compress=True)
+    return _BULK_CLIENT
+
+
+def close_opensearch_client() -> None:
+    """Close the process-wide clients if they were ever created."""
+    global _CLIENT, _BULK_CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None:
+            _CLIENT.close()
+            _CLIENT = None
+        if _BULK_CLIENT is not None:
+            _BULK_CLIENT.close()
+            _BULK_CLIENT = None
+
+
+def create_index_if_missing(client: OpenSearch, index: str, body: dict) -> bool:
+    """Create an index in a single round-trip; return False if it already existed.
+
+    Replaces the indices.exists + indices.create pair.
+    """
+    try:
+        client.indices.create(index=index, body=body)
+        return True
+    except RequestError as exc:
+        if exc.error == "resource_already_exists_exception":
+            return False
+        raise
+
+
+# Bulk loads currently running per index, and the refresh_interval to restore
+# when the last one finishes (guarded by _BULK_INDEXING_LOCK)
+_BULK_INDEXING_LOCK = threading.Lock()
+_BULK_INDEXING: Dict[str, Tuple[int, Optional[str]]] = {}
+
+
+@contextmanager
+def bulk_indexing(client: OpenSearch, index: str):
+    """Disable periodic refresh on an index for the duration of a bulk load.
+
+    Overlapping loads on the same index are reference-counted: only the first
+    one disables refresh and only the last one restores the previous
+    refresh_interval (or the cluster default if none was set) and refreshes
+    the index once, so the loaded documents become searchable straight away.
+    A "-1" found on entry (left behind by an interrupted load or another
+    process) is never restored; the cluster default is used instead.
+    """
+    with _BULK_INDEXING_LOCK:
+        count, previous = _BULK_INDEXING.get(index, (0, None))
+        if count == 0:
+            settings = client.indices.get_settings(index=index, name="index.refresh_interval", flat_settings=True)
+            previous = settings.get(index, {}).get("settings", {}).get("index.refresh_interval")
+            if previous == "-1":
+                previous = None
+            client.indices.put_settings(index=index, body={"index": {"refresh_interval": "-1"}})
+        _BULK_INDEXING[index] = (count + 1, previous)
+    try:
+        yield
+    finally:
+        with _BULK_INDEXING_LOCK:
+            count, previous = _BULK_INDEXING.pop(index)
+            if count > 1:
+                _BULK_INDEXING[index] = (count - 1, previous)
+            else:
+                client.indices.put_settings(index=index, body={"index": {"refresh_interval": previous}})
+                client.indices.refresh(index=index)
+
+
+_SCAN_IDS_FILTER_PATH = "_scroll_id,_shards,hits.hits._id"
+
+
+def iter_all_ids(client: OpenSearch, index: str, page_size: int = 1000) -> Iterator[str]:
+    """Yield every document _id of an index by streaming it with the scroll API.
+
+    Unlike a single size-capped search, the whole index is returned no matter
+    how large it grows, and _source is never fetched. Raises NotFoundError if
+    the index does not exist.
+    """
+    for h in scan(
+        client,
+        index=index,
+        query={"query": {"match_all": {}}},
+        _source=False,
+        size=page_size,
+        preserve_order=False,
+        scroll="1m",
+        # Only what scan needs (scroll id + shard status) and the ids themselves
+        filter_path=_SCAN_IDS_FILTER_PATH,
+        scroll_kwargs={"filter_path": _SCAN_IDS_FILTER_PATH},
+    ):
+        yield h["_id"]
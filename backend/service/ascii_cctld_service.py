@@ -1,44 +1,48 @@
 #app/backend/service/ascii_cctld_service.py
 
-from typing import List, Optional, Dict, Any
-from opensearch_client import get_opensearch_client 
+from typing import FrozenSet, List, Optional, Dict, Any
+from cachetools import TTLCache
+from opensearch_client import get_opensearch_client_cached, iter_all_ids
 from opensearchpy.exceptions import NotFoundError
 
 INDEX_ASCII_CCTLD = "ascii_cctld"
 
+# La lista de ccTLDs es prácticamente estática: se consulta una vez por hora como mucho
+_TLD_CACHE = TTLCache(maxsize=1, ttl=3600)
 
-def get_all_ascii_cctld_ids() -> List[str]:
+
+def get_all_ascii_cctld_ids() -> FrozenSet[str]:
     """
-    Devuelve una lista con todos los _id del índice 'ascii_cctld'.
+    Devuelve un frozenset con todos los _id del índice 'ascii_cctld'.
     Se asume que el _id es el propio TLD (ej: 'es', 'fr').
+    El resultado se cachea (ver _TLD_CACHE); un índice vacío o inexistente no se cachea.
     """
-    client = get_opensearch_client()
-    
+    ids = _TLD_CACHE.get("ids")
+    if ids is None:
+        ids = _fetch_all_ascii_cctld_ids()
+        if ids:
+            _TLD_CACHE["ids"] = ids
+    return ids
 
-    # Verificamos existencia para evitar error 404 si el índice aún no se creó
-    if not client.indices.exists(index=INDEX_ASCII_CCTLD):
-        return []
+def clear_ascii_cctld_cache() -> None:
+    _TLD_CACHE.clear()
 
-    resp = client.search(
-        index=INDEX_ASCII_CCTLD,
-        body={
-            "size": 1000,       # Suficiente para todos los ccTLDs ASCII existentes (son < 300)
-            "_source": False,   # Optimización: No traemos el cuerpo, solo metadatos (_id)
-            "query": {
-                "match_all": {}
-            }
-        }
-    )
+def _fetch_all_ascii_cctld_ids() -> FrozenSet[str]:
+    client = get_opensearch_client_cached()
+    
 
-    hits = resp.get("hits", {}).get("hits", [])
-    return [h["_id"] for h in hits]
+    # Si el índice aún no se creó, el scroll da 404: sin sonda exists previa
+    try:
+        return frozenset(iter_all_ids(client, INDEX_ASCII_CCTLD))
+    except NotFoundError:
+        return frozenset()
 
 def get_ascii_cctld_by_id(tld: str) -> Optional[Dict[str, Any]]:
     """
     Obtiene los datos (_source) de un TLD específico buscando por su _id.
     Retorna None si el TLD no existe.
     """
-    client = get_opensearch_client()
+    client = get_opensearch_client_cached()
 
     try:
         doc = client.get(index=INDEX_ASCII_CCTLD, id=tld)
@@ -46,25 +50,39 @@ def get_ascii_cctld_by_id(tld: str) -> Optional[Dict[str, Any]]:
     except NotFoundError:
         return None
 
-def get_fallback_by_id(tld: str) -> List[str]:
+def get_fallbacks_by_ids(tlds: List[str]) -> Dict[str, List[str]]:
     """
-    Devuelve la lista 'fallback' de un TLD específico dado su _id.
-    Retorna una lista vacía [] si el TLD no existe o no tiene campo fallback.
+    Devuelve {tld: fallback} para varios TLDs en una sola petición (mget).
+    Los TLDs que no existen no aparecen en el resultado.
     """
-    client = get_opensearch_client()
+    if not tlds:
+        return {}
+
+    client = get_opensearch_client_cached()
 
     try:
         # Usamos _source_includes para traer SOLO el campo fallback
-        doc = client.get(
-            index=INDEX_ASCII_CCTLD, 
-            id=tld, 
+        resp = client.mget(
+            index=INDEX_ASCII_CCTLD,
+            body={"ids": list(tlds)},
             _source_includes=["fallback"]
         )
-        # Obtenemos el source y luego el campo, por defecto lista vacía
-        return doc.get("_source", {}).get("fallback", [])
     except NotFoundError:
-        # Si el ID no existe, devolvemos lista vacía para evitar errores al iterar
-        return []
+        return {}
+
+    return {
+        doc["_id"]: doc.get("_source", {}).get("fallback", [])
+        for doc in resp.get("docs", [])
+        if doc.get("found")
+    }
+
+def get_fallback_by_id(tld: str) -> List[str]:
+    """
+    Devuelve la lista 'fallback' de un TLD específico dado su _id.
+    Retorna una lista vacía [] si el TLD no existe o no tiene campo fallback.
+    """
+    # Si el ID no existe, devolvemos lista vacía para evitar errores al iterar
+    return get_fallbacks_by_ids([tld]).get(tld, [])
 
 
 """if __name__ == "__main__":
@@ -1,71 +1,112 @@
 # app/backend/service/ascii_geotld_service.py
-from typing import List, Optional, Dict, Any
-from opensearch_client import get_opensearch_client 
+from typing import FrozenSet, List, Optional, Dict, Any
+from cachetools import TTLCache
+from cachetools.func import ttl_cache
+from opensearch_client import get_opensearch_client_cached, iter_all_ids
 from opensearchpy.exceptions import NotFoundError
 
 INDEX_ASCII_GEOTLD = "ascii_geotld"
 
+# El listado de TLDs es prácticamente estático: se consulta una vez por hora como mucho
+_TLD_CACHE = TTLCache(maxsize=1, ttl=3600)
 
-def get_all_ascii_geotld_ids() -> List[str]:
+
+def get_all_ascii_geotld_ids() -> FrozenSet[str]:
     """
-    Devuelve una lista con todos los _id del índice 'ascii_geotld'.
+    Devuelve un frozenset con todos los _id del índice 'ascii_geotld'.
     Se asume que el _id es el propio GeoTLD (ej: 'cat', 'eus', 'madrid').
+    El resultado se cachea (ver _TLD_CACHE); un índice vacío o inexistente no se cachea.
+    """
+    ids = _TLD_CACHE.get("ids")
+    if ids is None:
+        ids = _fetch_all_ascii_geotld_ids()
+        if ids:
+            _TLD_CACHE["ids"] = ids
+    return ids
+
+
+def _fetch_all_ascii_geotld_ids() -> FrozenSet[str]:
+    client = get_opensearch_client_cached()
+
+    # Si el índice aún no se creó, el scroll da 404: sin sonda exists previa
+    try:
+        return frozenset(iter_all_ids(client, INDEX_ASCII_GEOTLD))
+    except NotFoundError:
+        return frozenset()
+
+
+def get_ascii_geotlds_by_ids(tlds: List[str]) -> Dict[str, Dict[str, Any]]:
     """
-    client = get_opensearch_client()
+    Devuelve {tld: _source} para varios GeoTLDs en una sola petición (mget).
+    Los TLDs que no existen no aparecen en el resultado.
+    """
+    if not tlds:
+        return {}
 
-    # Verificamos existencia para evitar error 404
-    if not client.indices.exists(index=INDEX_ASCII_GEOTLD):
-        return []
+    client = get_opensearch_client_cached()
 
-    resp = client.search(
-        index=INDEX_ASCII_GEOTLD,
-        body={
-            "size": 1000,       # Suficiente para los GeoTLDs actuales
-            "_source": False,   # Optimización: Solo traemos metadatos (_id)
-            "query": {
-                "match_all": {}
-            }
-        }
-    )
+    try:
+        resp = client.mget(index=INDEX_ASCII_GEOTLD, body={"ids": list(tlds)})
+    except NotFoundError:
+        return {}
 
-    hits = resp.get("hits", {}).get("hits", [])
-    return [h["_id"] for h in hits]
+    return {
+        doc["_id"]: doc.get("_source")
+        for doc in resp.get("docs", [])
+        if doc.get("found")
+    }
 
 
+# Caché de 1h: la tabla de GeoTLDs apenas cambia y se consulta por cada dominio procesado
+@ttl_cache(maxsize=4096, ttl=3600)
 def get_ascii_geotld_by_id(tld: str) -> Optional[Dict[str, Any]]:
     """
     Obtiene los datos (_source) de un GeoTLD específico buscando por su _id.
     Retorna None si el TLD no existe.
     """
-    client = get_opensearch_client()
+    return get_ascii_geotlds_by_ids([tld]).get(tld)
+
+
+def get_countries_by_ids(tlds: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Devuelve {tld: country} para varios GeoTLDs en una sola petición (mget).
+    Los TLDs que no existen no aparecen en el resultado.
+    """
+    if not tlds:
+        return {}
+
+    client = get_opensearch_client_cached()
 
     try:
-        doc = client.get(index=INDEX_ASCII_GEOTLD, id=tld)
-        return doc.get("_source")
+        # Usamos _source por documento para traer SOLO el campo country
+        resp = client.mget(
+            index=INDEX_ASCII_GEOTLD,
+            body={"docs": [{"_id": t, "_source": ["country"]} for t in tlds]}
+        )
     except NotFoundError:
-        return None
+        return {}
 
+    return {
+        doc["_id"]: (doc.get("_source") or {}).get("country")
+        for doc in resp.get("docs", [])
+        if doc.get("found")
+    }
 
+
+@ttl_cache(maxsize=4096, ttl=3600)
 def get_country_by_id(tld: str) -> Optional[str]:
     """
     Devuelve el campo 'country' (ej: 'es') de un GeoTLD específico dado su _id.
     Sustituye a la antigua función 'get_fallback_by_id'.
     Retorna None si el TLD no existe o el campo es nulo.
     """
-    
-    client = get_opensearch_client()
+    return get_countries_by_ids([tld]).get(tld)
 
-    try:
-        # Usamos _source_includes para traer SOLO el campo country
-        doc = client.get(
-            index=INDEX_ASCII_GEOTLD, 
-            id=tld, 
-            _source_includes=["country"]
-        )
-        # Obtenemos el source y luego el campo.
-        return doc.get("_source", {}).get("country")
-    except NotFoundError:
-        return None
+
+def clear_ascii_geotld_cache() -> None:
+    _TLD_CACHE.clear()
+    get_ascii_geotld_by_id.cache_clear()
+    get_country_by_id.cache_clear()
 
 
 """if __name__ == "__main__":    
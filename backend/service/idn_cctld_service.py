@@ -1,35 +1,59 @@
 #app/backend/service/idn_cctld_service.py
-from typing import List, Optional, Dict, Any
-from opensearch_client import get_opensearch_client 
+from typing import FrozenSet, List, Optional, Dict, Any
+from cachetools import TTLCache
+from opensearch_client import get_opensearch_client_cached, iter_all_ids
 from opensearchpy.exceptions import NotFoundError
 
 INDEX_IDN_CCTLD = "idn_cctld"
 
+# El listado de TLDs es prácticamente estático: se consulta una vez por hora como mucho
+_TLD_CACHE = TTLCache(maxsize=1, ttl=3600)
 
-def get_all_idn_cctld_ids() -> List[str]:
+
+def get_all_idn_cctld_ids() -> FrozenSet[str]:
     """
-    Devuelve una lista con todos los _id del índice 'idn_cctld'.
+    Devuelve un frozenset con todos los _id del índice 'idn_cctld'.
     Se asume que el _id es el TLD en formato punycode o nativo (ej: 'xn--p1ai').
+    El resultado se cachea (ver _TLD_CACHE); un índice vacío o inexistente no se cachea.
     """
-    client = get_opensearch_client()
+    ids = _TLD_CACHE.get("ids")
+    if ids is None:
+        ids = _fetch_all_idn_cctld_ids()
+        if ids:
+            _TLD_CACHE["ids"] = ids
+    return ids
+
 
-    # Verificamos existencia para evitar error 404 si el índice aún no se creó
-    if not client.indices.exists(index=INDEX_IDN_CCTLD):
-        return []
+def _fetch_all_idn_cctld_ids() -> FrozenSet[str]:
+    client = get_opensearch_client_cached()
+
+    # Si el índice aún no se creó, el scroll da 404: sin sonda exists previa
+    try:
+        return frozenset(iter_all_ids(client, INDEX_IDN_CCTLD))
+    except NotFoundError:
+        return frozenset()
 
-    resp = client.search(
-        index=INDEX_IDN_CCTLD,
-        body={
-            "size": 1000,       # Suficiente para cubrir los ccTLDs IDN actuales
-            "_source": False,   # Optimización: No traemos el cuerpo, solo metadatos (_id)
-            "query": {
-                "match_all": {}
-            }
-        }
-    )
 
-    hits = resp.get("hits", {}).get("hits", [])
-    return [h["_id"] for h in hits]
+def get_idn_cctlds_by_ids(tlds: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Devuelve {tld: _source} para varios IDN ccTLDs en una sola petición (mget).
+    Los TLDs que no existen no aparecen en el resultado.
+    """
+    if not tlds:
+        return {}
+
+    client = get_opensearch_client_cached()
+
+    try:
+        resp = client.mget(index=INDEX_IDN_CCTLD, body={"ids": list(tlds)})
+    except NotFoundError:
+        return {}
+
+    return {
+        doc["_id"]: doc.get("_source")
+        for doc in resp.get("docs", [])
+        if doc.get("found")
+    }
 
 
 def get_idn_cctld_by_id(tld: str) -> Optional[Dict[str, Any]]:
@@ -37,13 +61,11 @@ def get_idn_cctld_by_id(tld: str) -> Optional[Dict[str, Any]]:
     Obtiene los datos (_source) de un IDN ccTLD específico buscando por su _id.
     Retorna None si el TLD no existe.
     """
-    client = get_opensearch_client()
+    return get_idn_cctlds_by_ids([tld]).get(tld)
 
-    try:
-        doc = client.get(index=INDEX_IDN_CCTLD, id=tld)
-        return doc.get("_source")
-    except NotFoundError:
-        return None
+
+def clear_idn_cctld_cache() -> None:
+    _TLD_CACHE.clear()
 
 
 """if __name__ == "__main__":
@@ -1,14 +1,51 @@
 # backend/service/known_brands_v3_service.py
 
 import re
-from typing import List, Dict, Optional
-import Levenshtein
-import tldextract
-from opensearchpy import NotFoundError
-from opensearch_client import get_opensearch_client 
+import string
+from functools import lru_cache
+from typing import List, Dict, Optional, Set, Tuple
+from cachetools import TTLCache
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+from service.utils.domain import tld_extract
+from opensearchpy import ConflictError, NotFoundError, TransportError, helpers
+from opensearchpy.exceptions import HTTP_EXCEPTIONS
+from opensearch_client import get_opensearch_client_cached, get_opensearch_bulk_client, create_index_if_missing, iter_all_ids
 
 INDEX_KNOWN_BRANDS = "known_brands_v3"
 
+# Patrones precompilados (se usan en cada alta/enriquecimiento de brand)
+_BRAND_ID_RE = re.compile(r"[^a-z0-9-]+")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+# Misma limpieza que _PUNCT_RE para texto ASCII, en una sola pasada en C ('_' cuenta como \w)
+_PUNCT_TABLE = str.maketrans({c: " " for c in string.punctuation if c != "_"})
+
+# Campos de la brand que realmente leen los consumidores (sanitize_email, recognition):
+# domain_search y owner_terms_raw no viajan por la red en las lecturas
+_BRAND_SOURCE = ["sector", "country_code", "known_domains", "owner_terms"]
+
+# Caché por dominio de las búsquedas sobre known_domains (hit o None). Se invalida por brand al escribir
+_BRAND_LOOKUP_CACHE = TTLCache(maxsize=50_000, ttl=300)
+_MISSING = object()
+
+# Sustituciones l33t de _normalize_visuals en una única pasada
+_VISUAL_TABLE = str.maketrans({
+    '4': 'a', '3': 'e', '1': 'i', '0': 'o', '5': 's', '7': 't', '8': 'b'
+})
+
+# Mismo char_filter que 'normalizacion_visual' del mapping ('-' pasa a espacio)
+_GRAM_TABLE = str.maketrans({
+    '-': ' ', '4': 'a', '3': 'e', '1': 'i', '0': 'o', '5': 's', '7': 't', '8': 'b'
+})
+# Equivalente a token_chars ["letter", "digit"] de los tokenizers n-gram
+_GRAM_WORD_RE = re.compile(r"[^\W_]+")
+
+# N-gramas (2 y 3) de todos los brand_id; se reconstruye como mucho una vez por hora
+_BRAND_GRAMS_CACHE = TTLCache(maxsize=1, ttl=3600)
+
+# Fuzziness acotada: los 2 primeros caracteres deben coincidir y como mucho 50 términos expandidos
+_FUZZY_OPTS = {"fuzziness": "AUTO", "prefix_length": 2, "max_expansions": 50}
+
 # ---------------------------------------------------------
 # NORMALIZACIÓN Y UTILIDADES
 # ---------------------------------------------------------
@@ -16,40 +53,44 @@ INDEX_KNOWN_BRANDS = "known_brands_v3"
 def _normalize_brand_id(s: str) -> str:
     s = (s or "").strip().lower()
     # nos quedamos solo con letras y números
-    return re.sub(r"[^a-z0-9-]+", "", s)
+    return _BRAND_ID_RE.sub("", s)
 
 def _normalize_visuals(text: str) -> str:
     """Sustituye caracteres visualmente similares (l33t speak) para mejorar el match."""
-    replacements = {
-        '4': 'a', '3': 'e', '1': 'i', '0': 'o', '5': 's', '7': 't', '8': 'b'
-    }
-    for char, replacement in replacements.items():
-        text = text.replace(char, replacement)
-    return text
+    return text.translate(_VISUAL_TABLE)
 
+@lru_cache(maxsize=4096)
 def _normalize_domain_for_search(domain: str) -> str:
     """Extrae la parte principal del dominio y quita guiones para la búsqueda."""
-    ext = tldextract.extract(domain)
     # Si entra 'pay-pal.es' -> devuelve 'paypal'
     # Si entra 'athetic-club' -> devuelve 'atheticclub'
-    clean = ext.domain.lower().replace("-", "")
+    if "." not in domain:
+        # Ya es una etiqueta suelta (lo habitual desde recognition): no hace falta la PSL.
+        # Además evita que marcas que son gTLD ('amazon') se queden en cadena vacía
+        main = domain
+    else:
+        main = tld_extract(domain).domain
+    clean = main.lower().replace("-", "")
     return clean
 
 def _tokenize_str(text: str) -> List[str]:
     if not text: return []
-    text = re.sub(r"[^\w\s]", " ", text.lower())
-    return [t for t in text.split() if t]
+    text = text.lower()
+    # split() sin argumentos ya descarta tokens vacíos
+    if text.isascii():
+        return text.translate(_PUNCT_TABLE).split()
+    return _PUNCT_RE.sub(" ", text).split()
 
 # ---------------------------------------------------------
 # GESTIÓN DEL ÍNDICE (MAPPING V3)
 # ---------------------------------------------------------
 
+# Una vez comprobado/creado en este proceso, las siguientes llamadas no tocan OpenSearch
+# (si falla, lru_cache no guarda nada y se reintenta en la próxima llamada)
+@lru_cache(maxsize=1)
 def ensure_known_brands_v3_index() -> None:
 
-    client = get_opensearch_client()
-
-    if client.indices.exists(index=INDEX_KNOWN_BRANDS):
-        return
+    client = get_opensearch_client_cached()
 
     body = {
         "settings": {
@@ -72,13 +113,11 @@ def ensure_known_brands_v3_index() -> None:
                 },
                 "analyzer": {
                     "ana_2": { "tokenizer": "tok_2", "filter": ["lowercase"], "char_filter": ["normalizacion_visual"] },
-                    "ana_3": { "tokenizer": "tok_3", "filter": ["lowercase"], "char_filter": ["normalizacion_visual"] },
-                    "ana_4": { "tokenizer": "tok_4", "filter": ["lowercase"], "char_filter": ["normalizacion_visual"] }
+                    "ana_3": { "tokenizer": "tok_3", "filter": ["lowercase"], "char_filter": ["normalizacion_visual"] }
                 },
                 "tokenizer": {
                     "tok_2": { "type": "ngram", "min_gram": 2, "max_gram": 2, "token_chars": ["letter", "digit"] },
-                    "tok_3": { "type": "ngram", "min_gram": 3, "max_gram": 3, "token_chars": ["letter", "digit"] },
-                    "tok_4": { "type": "ngram", "min_gram": 4, "max_gram": 4, "token_chars": ["letter", "digit"] }
+                    "tok_3": { "type": "ngram", "min_gram": 3, "max_gram": 3, "token_chars": ["letter", "digit"] }
                 }
             }
         },
@@ -86,6 +125,8 @@ def ensure_known_brands_v3_index() -> None:
             "properties": {
                 "sector": { "type": "keyword" },
                 "known_domains": { "type": "keyword" },
+                # tokens de owner ya normalizados: el merge se hace sobre este array sin re-tokenizar
+                "owner_terms_raw": { "type": "keyword" },
                 "owner_terms": {
                     "type": "keyword",
                     "fields": {
@@ -93,18 +134,19 @@ def ensure_known_brands_v3_index() -> None:
                         "3gram": {"type": "text", "analyzer": "ana_3", "norms": False, "similarity": "boolean"}
                     }
                 },
+                # solo los subcampos que consulta identify_brand_by_similarity (<=5 chars: 2gram, resto: 3gram)
                 "domain_search": {
                     "type": "text",
                     "fields": {
                         "2gram": { "type": "text", "analyzer": "ana_2", "norms": False, "similarity": "boolean" },
-                        "3gram": { "type": "text", "analyzer": "ana_3", "norms": False, "similarity": "boolean" },
-                        "4gram": { "type": "text", "analyzer": "ana_4", "norms": False, "similarity": "boolean" }
+                        "3gram": { "type": "text", "analyzer": "ana_3", "norms": False, "similarity": "boolean" }
                     }
                 }
             }
         }
     }
-    client.indices.create(index=INDEX_KNOWN_BRANDS, body=body)
+    # Una sola petición: si el índice ya existe, OpenSearch lo rechaza y no hacemos nada
+    create_index_if_missing(client, INDEX_KNOWN_BRANDS, body)
 
 # ---------------------------------------------------------
 # OPERACIONES DE ESCRITURA (UPSERT)
@@ -120,35 +162,77 @@ def upsert_brand(
     Crea o actualiza una brand completa con el NUEVO formato.
     """
     
-    client = get_opensearch_client()
+    client = get_opensearch_client_cached()
     
     # El domain_search se nutre del brand_id automáticamente por el mapping
     payload = {
         "sector": sector,
         "owner_terms": owner_terms or [],
+        "owner_terms_raw": owner_terms.split() if isinstance(owner_terms, str) else list(owner_terms or []),
         "known_domains": known_domains or [],
         "domain_search": brand_id 
     }
     client.index(index=INDEX_KNOWN_BRANDS, id=brand_id, body=payload)
+    _register_brand_grams(brand_id)
+    _invalidate_brand_lookups(brand_id, *(known_domains or []))
+
+# ---------------------------------------------------------
+# PRE-FILTRO DE N-GRAMAS EN MEMORIA
+# ---------------------------------------------------------
+
+def _grams(text: str, sizes: Tuple[int, ...] = (2, 3)) -> Set[str]:
+    """N-gramas tal y como los genera ana_2/ana_3 sobre domain_search."""
+    out = set()
+    for word in _GRAM_WORD_RE.findall(text.lower().translate(_GRAM_TABLE)):
+        for n in sizes:
+            out.update(word[i:i + n] for i in range(len(word) - n + 1))
+    return out
+
+def _get_brand_grams() -> Set[str]:
+    """
+    Conjunto con los 2-gramas y 3-gramas de todos los brand_id (domain_search = brand_id).
+    Si un término no comparte ningún n-grama con él, la búsqueda por n-gramas no puede dar candidatos.
+    """
+    grams = _BRAND_GRAMS_CACHE.get("grams")
+    if grams is None:
+        client = get_opensearch_client_cached()
+        grams = set()
+        try:
+            for brand_id in iter_all_ids(client, INDEX_KNOWN_BRANDS):
+                grams |= _grams(brand_id)
+        except NotFoundError:
+            pass
+        _BRAND_GRAMS_CACHE["grams"] = grams
+    return grams
+
+def _register_brand_grams(brand_id: str) -> None:
+    """Añade al conjunto en memoria los n-gramas de una brand recién escrita (sin esperar al TTL)."""
+    grams = _BRAND_GRAMS_CACHE.get("grams")
+    if grams is not None:
+        grams |= _grams(brand_id)
+
+def clear_brand_grams_cache() -> None:
+    _BRAND_GRAMS_CACHE.clear()
 
 # ---------------------------------------------------------
 # BÚSQUEDA AVANZADA (EL NÚCLEO V3)
 # ---------------------------------------------------------
 
 def _backup_fuzzy_match(client, clean_input):
+    domain_match = {
+        "query": clean_input,
+        "boost": 1
+    }
     should_clauses = [
         {
             "match": {
-                "domain_search": {
-                    "query": clean_input,
-                    "boost": 1,
-                    "fuzziness": "AUTO"
-                }
+                "domain_search": domain_match
             }
         }
     ]
     body = {
         "size": 1,
+        "_source": _BRAND_SOURCE,
         "query": {
             "bool": {
                 "should": should_clauses,
@@ -156,9 +240,14 @@ def _backup_fuzzy_match(client, clean_input):
             }
         }
     }
+    # Primero match plano; el autómata de Levenshtein (fuzziness) solo si no hay nada
     resp = client.search(index=INDEX_KNOWN_BRANDS, body=body)
-    # Verificamos si hay hits antes de procesar
     hits = resp.get("hits", {}).get("hits", [])
+    if not hits:
+        domain_match.update(_FUZZY_OPTS)
+        resp = client.search(index=INDEX_KNOWN_BRANDS, body=body)
+        # Verificamos si hay hits antes de procesar
+        hits = resp.get("hits", {}).get("hits", [])
 
     if not hits:
         return None
@@ -174,32 +263,131 @@ def _backup_fuzzy_match(client, clean_input):
         "match_type": "similarity"
     }
 
+def _norm_known_domain(domain: str) -> str:
+    return (domain or "").strip().lower().rstrip(".")
+
+def _cache_brand_lookup(domain: str, hit: Optional[Dict]) -> None:
+    _BRAND_LOOKUP_CACHE[domain] = hit
+
+def _invalidate_brand_lookups(brand_id: str, *domains: str) -> None:
+    """
+    Tras escribir en una brand: fuera los dominios cacheados que apuntaban a ella
+    (su _source ha cambiado) y los dominios que acaban de asignársele.
+    Se recorre la propia caché (acotada): sin índice inverso que crezca aparte.
+    """
+    stale = [d for d, hit in list(_BRAND_LOOKUP_CACHE.items()) if hit is not None and hit.get("_id") == brand_id]
+    stale.extend(_norm_known_domain(d) for d in domains)
+    for d in stale:
+        _BRAND_LOOKUP_CACHE.pop(d, None)
+
+def clear_brand_lookup_cache() -> None:
+    _BRAND_LOOKUP_CACHE.clear()
+
 def find_brand_by_known_domain(domain: str) -> Optional[Dict]:
     """
     ¿Este dominio ya pertenece a alguna brand?
     Búsqueda por coincidencia EXACTA sobre known_domains (keyword).
     """
-
-    client = get_opensearch_client()
-
     # normalizamos un poco el dominio de entrada
-    domain = (domain or "").strip().lower().rstrip(".")
+    domain = _norm_known_domain(domain)
+    return find_brands_by_known_domains([domain]).get(domain)
 
-    resp = client.search(
-        index=INDEX_KNOWN_BRANDS,
-        body={
-            "size": 1,
-            "query": {
-                "term": {
-                    "known_domains": {
-                        "value": domain
+def find_brands_by_known_domains(domains: List[str]) -> Dict[str, Optional[Dict]]:
+    """
+    Versión por lotes de find_brand_by_known_domain: una única petición _msearch
+    con un term query por dominio. Devuelve {dominio_normalizado: hit | None}.
+    Los dominios ya cacheados (ver _BRAND_LOOKUP_CACHE) no se consultan.
+    """
+    domains = list(dict.fromkeys(_norm_known_domain(d) for d in domains))
+    if not domains:
+        return {}
+
+    result: Dict[str, Optional[Dict]] = {}
+    missing = []
+    for d in domains:
+        hit = _BRAND_LOOKUP_CACHE.get(d, _MISSING)
+        if hit is _MISSING:
+            missing.append(d)
+        else:
+            result[d] = hit
+
+    if missing:
+        client = get_opensearch_client_cached()
+
+        body = []
+        for d in missing:
+            body.append({})
+            body.append({"size": 1, "_source": _BRAND_SOURCE, "query": {"term": {"known_domains": {"value": d}}}})
+
+        resp = client.msearch(index=INDEX_KNOWN_BRANDS, body=body)
+
+        error = None
+        for d, r in zip(missing, resp.get("responses", [])):
+            if "error" in r:
+                # Un fallo (índice inexistente, shards caídas...) no es "sin brand": no se cachea
+                error = error or r
+                continue
+            hits = r.get("hits", {}).get("hits", [])
+            result[d] = hits[0] if hits else None
+            _cache_brand_lookup(d, result[d])
+
+        # Misma excepción que lanzaría la búsqueda individual (p.ej. NotFoundError si falta el índice)
+        if error is not None:
+            status = error.get("status", 500)
+            err = error["error"]
+            err_type = err.get("type") if isinstance(err, dict) else str(err)
+            raise HTTP_EXCEPTIONS.get(status, TransportError)(status, err_type, error)
+
+    return {d: result.get(d) for d in domains}
+
+def find_brand_by_any_domain(domains: List[str]) -> Optional[Dict]:
+    """
+    Igual que find_brand_by_known_domain, pero para varios dominios en UNA búsqueda
+    (terms sobre known_domains). Si varios coinciden, gana el primero de la lista.
+    Los dominios ya cacheados (ver _BRAND_LOOKUP_CACHE) no se consultan.
+    """
+    domains = [d for d in dict.fromkeys(_norm_known_domain(d) for d in domains) if d]
+    if not domains:
+        return None
+
+    by_domain: Dict[str, Optional[Dict]] = {}
+    missing = []
+    for d in domains:
+        hit = _BRAND_LOOKUP_CACHE.get(d, _MISSING)
+        if hit is _MISSING:
+            missing.append(d)
+        else:
+            by_domain[d] = hit
+
+    hits = []
+    if missing:
+        client = get_opensearch_client_cached()
+
+        resp = client.search(
+            index=INDEX_KNOWN_BRANDS,
+            body={
+                "size": len(missing),
+                "_source": _BRAND_SOURCE,
+                "query": {
+                    "terms": {
+                        "known_domains": missing
                     }
                 }
             }
-        }
-    )
+        )
 
-    hits = resp.get("hits", {}).get("hits", [])
+        hits = resp.get("hits", {}).get("hits", [])
+        for d in missing:
+            by_domain[d] = next(
+                (h for h in hits if d in (h.get("_source", {}).get("known_domains") or [])),
+                None
+            )
+            _cache_brand_lookup(d, by_domain[d])
+
+    # respetamos la prioridad de la lista de entrada
+    for d in domains:
+        if by_domain[d] is not None:
+            return by_domain[d]
     return hits[0] if hits else None
 
 def identify_brand_by_similarity(domain_input: str) -> Optional[Dict]:
@@ -209,12 +397,12 @@ def identify_brand_by_similarity(domain_input: str) -> Optional[Dict]:
     2. Refinamiento por distancia de Levenshtein.
     """
 
-    client = get_opensearch_client()
+    client = get_opensearch_client_cached()
     
     # 1. Match Directo (Prioridad Máxima)
     try:
         clean_input = domain_input.split('.')[0].lower()
-        res = client.get(index=INDEX_KNOWN_BRANDS, id=clean_input)
+        res = client.get(index=INDEX_KNOWN_BRANDS, id=clean_input, _source_includes=_BRAND_SOURCE)
         return {**res['_source'], "id": res['_id'], "match_type": "exact"}
     except NotFoundError:
         pass
@@ -226,14 +414,20 @@ def identify_brand_by_similarity(domain_input: str) -> Optional[Dict]:
     longitud = len(search_term_visual)
 
     if longitud <= 5: 
-        subcampo = "2gram"
+        subcampo, n = "2gram", 2
         msm = "70%"
     else:
-        subcampo = "3gram"
+        subcampo, n = "3gram", 3
         msm = "45%"
 
+    # Ningún n-grama en común con las brands conocidas: nos ahorramos la búsqueda por n-gramas
+    if _grams(search_term_visual, (n,)).isdisjoint(_get_brand_grams()):
+        return _backup_fuzzy_match(client, clean_input)
+
+    # _source recortado a los campos que usa el llamante: el ganador sale de esta misma respuesta
     query = {
         "size": 30,
+        "_source": _BRAND_SOURCE,
         "query": {
             "match": {
                 f"domain_search.{subcampo}": {
@@ -255,16 +449,17 @@ def identify_brand_by_similarity(domain_input: str) -> Optional[Dict]:
 
 
     # 3.2: Refinamiento por Levenshtein (Usando la forma con guiones)
-    mejor_match = None
-    distancia_min = 99
+    # extractOne recorre todos los ids en C y devuelve el primero con distancia mínima
+    # (mismo desempate que el bucle anterior); el resultado es (id, distancia, índice)
+    mejor = process.extractOne(
+        clean_input,
+        [c['_id'] for c in candidatos], # 'athetic-club'
+        scorer=Levenshtein.distance
+    )
+    if not mejor:
+        return None
 
-    for c in candidatos:
-        db_id = c['_id'] # 'athetic-club'
-        dist = Levenshtein.distance(clean_input, db_id)
-        
-        if dist < distancia_min:
-            distancia_min = dist
-            mejor_match = c
+    mejor_match = candidatos[mejor[2]]
 
     return mejor_match
 
@@ -274,7 +469,7 @@ def guess_brand_from_whois(owner_str: str, max_results: int = 3) -> List[Dict]:
     Devuelve las marcas más probables en función del WHOIS owner.
     Pondera fuertemente 'domain_search' y usa un sistema de puntos por token para 'owner_terms'.
     """
-    client = get_opensearch_client()
+    client = get_opensearch_client_cached()
     
     owner_str = (owner_str or "").strip()
     if not owner_str:
@@ -284,18 +479,29 @@ def guess_brand_from_whois(owner_str: str, max_results: int = 3) -> List[Dict]:
     # no tenemos analizadores para 1-gram y solo meterían ruido.
     tokens = [t for t in owner_str.split() if len(t) >= 2]
 
-    # 1. Cláusula original para domain_search (Se mantiene igual)
-    should_clauses = [
-        {
-            "match": {
-                "domain_search": {
-                    "query": owner_str,
-                    "boost": 5,
-                    "fuzziness": "AUTO"
+    # 1. Cláusula original para domain_search (fuzziness solo en el reintento, ver abajo)
+    domain_match = {
+        "query": owner_str,
+        "boost": 5
+    }
+    domain_clause = {
+        "match": {
+            "domain_search": domain_match
+        }
+    }
+    should_clauses = [domain_clause]
+
+    # Nombres cortos ("Banco Santander"): frase exacta contra owner_terms (keyword con los tokens
+    # normalizados, ver _tokenize_str). domain_search solo guarda el brand_id: ahí sigue el match suelto
+    if len(tokens) <= 2:
+        should_clauses.append({
+            "match_phrase": {
+                "owner_terms": {
+                    "query": " ".join(_tokenize_str(owner_str)),
+                    "boost": 5
                 }
             }
-        }
-    ]
+        })
 
     # 2. Nueva lógica de "Puntos" para owner_terms
     if tokens:
@@ -331,6 +537,7 @@ def guess_brand_from_whois(owner_str: str, max_results: int = 3) -> List[Dict]:
 
     body = {
         "size": max_results,
+        "_source": _BRAND_SOURCE,
         "query": {
             "bool": {
                 "should": should_clauses,
@@ -340,37 +547,114 @@ def guess_brand_from_whois(owner_str: str, max_results: int = 3) -> List[Dict]:
     }
 
     resp = client.search(index=INDEX_KNOWN_BRANDS, body=body)
-    return resp["hits"]["hits"]
+    hits = resp["hits"]["hits"]
+    if not hits:
+        # Segundo intento, ahora sí con fuzziness en domain_search
+        domain_match.update(_FUZZY_OPTS)
+        resp = client.search(index=INDEX_KNOWN_BRANDS, body=body)
+        hits = resp["hits"]["hits"]
+    return hits
 
 # ---------------------------------------------------------
 # MANTENIMIENTO DE COLECCIONES
 # ---------------------------------------------------------
 
+# Reintentos de add_known_domain ante conflicto de versión (409)
+_ADD_KNOWN_DOMAIN_RETRIES = 5
+
 def add_known_domain(brand_id: str, domain: str) -> None:
     """
     Añade un dominio al array known_domains si no existe.
+    Unión calculada en cliente (sin script painless que compilar por llamada).
+    Escritura condicionada a la versión leída (if_seq_no/if_primary_term): si otra
+    llamada modifica la brand entre medias se relee y se reintenta, sin perder dominios.
     """
 
-    client = get_opensearch_client()
-
-    client.update(
-        index=INDEX_KNOWN_BRANDS,
-        id=brand_id,
-        body={
-            "script": {
-                "source": """
-                    if (ctx._source.known_domains == null) {
-                        ctx._source.known_domains = [];
-                    }
-                    if (!ctx._source.known_domains.contains(params.domain)) {
-                        ctx._source.known_domains.add(params.domain);
-                    }
-                """,
-                "lang": "painless",
-                "params": {"domain": domain}
+    client = get_opensearch_client_cached()
+
+    for attempt in range(_ADD_KNOWN_DOMAIN_RETRIES):
+        doc = client.get(index=INDEX_KNOWN_BRANDS, id=brand_id, _source_includes=["known_domains"])
+        known = doc.get("_source", {}).get("known_domains") or []
+        if isinstance(known, str):
+            known = [known]
+
+        # Ya lo tiene: ni siquiera escribimos
+        if domain in known:
+            return
+
+        try:
+            client.update(
+                index=INDEX_KNOWN_BRANDS,
+                id=brand_id,
+                body={
+                    "doc": {"known_domains": known + [domain]},
+                    "detect_noop": True
+                },
+                if_seq_no=doc["_seq_no"],
+                if_primary_term=doc["_primary_term"]
+            )
+        except ConflictError:
+            # 409: la brand cambió desde el get → releer y volver a unir
+            if attempt == _ADD_KNOWN_DOMAIN_RETRIES - 1:
+                raise
+            continue
+        break
+
+    _invalidate_brand_lookups(brand_id, domain)
+
+# Fragmento painless: une params.tokens en owner_terms_raw y rehace la frase owner_terms.
+# Brands antiguas sin owner_terms_raw se siembran una vez desde owner_terms.
+_OWNER_TERMS_MERGE = """
+    boolean ownerChanged = false;
+    if (ctx._source.owner_terms_raw == null) {
+        ctx._source.owner_terms_raw = [];
+        def ot = ctx._source.owner_terms;
+        if (ot instanceof String) {
+            ot = ot.splitOnToken(' ');
+        }
+        if (ot != null) {
+            for (t in ot) {
+                if (t != '' && !ctx._source.owner_terms_raw.contains(t)) {
+                    ctx._source.owner_terms_raw.add(t);
+                }
             }
         }
-    )
+        ownerChanged = true;
+    }
+    for (t in params.tokens) {
+        if (!ctx._source.owner_terms_raw.contains(t)) {
+            ctx._source.owner_terms_raw.add(t);
+            ownerChanged = true;
+        }
+    }
+    if (ownerChanged) {
+        ctx._source.owner_terms = String.join(' ', ctx._source.owner_terms_raw);
+    }
+"""
+
+_OWNER_TERMS_UNION_SCRIPT = _OWNER_TERMS_MERGE + """
+    if (!ownerChanged) {
+        ctx.op = 'noop';
+    }
+"""
+
+# Enriquecimiento completo de una brand existente: known_domains + owner_terms
+_ENRICH_BRAND_SCRIPT = """
+    boolean domainChanged = false;
+    if (ctx._source.known_domains == null) {
+        ctx._source.known_domains = [];
+    } else if (!(ctx._source.known_domains instanceof List)) {
+        ctx._source.known_domains = [ctx._source.known_domains];
+    }
+    if (!ctx._source.known_domains.contains(params.domain)) {
+        ctx._source.known_domains.add(params.domain);
+        domainChanged = true;
+    }
+""" + _OWNER_TERMS_MERGE + """
+    if (!domainChanged && !ownerChanged) {
+        ctx.op = 'noop';
+    }
+"""
 
 def add_owner_terms(brand_id: str, owner_str: str) -> None:
     """
@@ -378,45 +662,63 @@ def add_owner_terms(brand_id: str, owner_str: str) -> None:
     owner_terms es la “bolsa de términos” que nutre el fuzzy.
     """
     
-    client = get_opensearch_client()
+    client = get_opensearch_client_cached()
 
     # tokens nuevos (normalizados) que vienen del WHOIS actual
     new_tokens = _tokenize_str(owner_str)
     if not new_tokens:
         return
 
-    try:
-        doc = client.get(index=INDEX_KNOWN_BRANDS, id=brand_id)
-        src = doc["_source"]
-        existing_terms = src.get("owner_terms", "") or ""
-    except NotFoundError:
-        existing_terms = ""
-
-    # tokens ya existentes en la brand (normalizados igual)
-    if existing_terms:
-        existing_tokens = _tokenize_str(existing_terms)
-    else:
-        existing_tokens = []
-
-    # merge sin duplicados, preservando el orden “antiguos primero”
-    seen = set()
-    merged_tokens: List[str] = []
-    for t in existing_tokens + new_tokens:
-        if t not in seen:
-            seen.add(t)
-            merged_tokens.append(t)
-
-    phrase = " ".join(merged_tokens)
-
+    # Unión en servidor sobre owner_terms_raw (sin get previo ni re-tokenizar en cliente).
+    # Brands antiguas sin owner_terms_raw se siembran una vez desde owner_terms.
+    # owner_terms se sigue escribiendo como frase porque lo usan los n-gramas.
     client.update(
         index=INDEX_KNOWN_BRANDS,
         id=brand_id,
         body={
-            "doc": {
-                "owner_terms": phrase
+            "script": {
+                "source": _OWNER_TERMS_UNION_SCRIPT,
+                "lang": "painless",
+                "params": {"tokens": list(dict.fromkeys(new_tokens))}
             }
         }
     )
+    _invalidate_brand_lookups(brand_id)
+
+def _ensure_brand_update(
+    root_domain: str,
+    owner_str: str,
+    sector: Optional[str] = None,
+    brand_id_hint: Optional[str] = None
+) -> Tuple[str, Dict]:
+    """
+    Calcula el brand_id y el cuerpo del update (script + upsert) que garantiza la brand.
+    Compartido por la versión unitaria y la de lotes.
+    """
+    ext = tld_extract(root_domain)
+
+    base = brand_id_hint or ext.domain or root_domain
+    brand_id = _normalize_brand_id(base)
+
+    owner_tokens = list(dict.fromkeys(_tokenize_str(owner_str)))
+
+    # - Brand existente → el script solo nutre known_domains + owner_terms
+    # - Brand nueva → se indexa 'upsert' tal cual (mismo payload que upsert_brand)
+    body = {
+        "script": {
+            "source": _ENRICH_BRAND_SCRIPT,
+            "lang": "painless",
+            "params": {"domain": root_domain, "tokens": owner_tokens}
+        },
+        "upsert": {
+            "sector": sector or None,
+            "owner_terms": " ".join(owner_tokens),
+            "owner_terms_raw": owner_tokens,
+            "known_domains": [root_domain],
+            "domain_search": brand_id
+        }
+    }
+    return brand_id, body
 
 def ensure_brand_for_root_domain(
     root_domain: str,
@@ -430,30 +732,55 @@ def ensure_brand_for_root_domain(
     - Si la brand YA existe → solo enriquece: known_domains + owner_terms.
     """
 
-    client = get_opensearch_client()
+    client = get_opensearch_client_cached()
 
-    ext = tldextract.extract(root_domain)
+    # Una sola petición (antes get + add_known_domain + add_owner_terms, o upsert_brand)
+    brand_id, body = _ensure_brand_update(root_domain, owner_str, sector, brand_id_hint)
+    client.update(index=INDEX_KNOWN_BRANDS, id=brand_id, body=body)
+    _register_brand_grams(brand_id)
+    _invalidate_brand_lookups(brand_id, root_domain)
+    return brand_id
 
-    base = brand_id_hint or ext.domain or root_domain
-    brand_id = _normalize_brand_id(base)
 
-    # ¿Ya existe la brand?
-    try:
-        client.get(index=INDEX_KNOWN_BRANDS, id=brand_id)
-        # ➜ Brand existente: solo nutrimos
-        add_known_domain(brand_id, root_domain)
-        add_owner_terms(brand_id, owner_str)
-        return brand_id
+def ensure_brands_for_root_domains(
+    items: List[Tuple[str, str, Optional[str]]],
+    sector: Optional[str] = None
+) -> List[str]:
+    """
+    Versión por lotes de ensure_brand_for_root_domain.
+    items: [(root_domain, owner_str, brand_id_hint), ...]
+    Un único _bulk con el mismo update (script + upsert) por item.
+    Devuelve los brand_id en el mismo orden que items; los items cuyo update falló se omiten.
+    """
+    if not items:
+        return []
 
-    except NotFoundError:
-        # ➜ Brand nueva: creamos desde cero
-        owner_tokens = _tokenize_str(owner_str)
-        owner_terms = " ".join(owner_tokens)
-
-        upsert_brand(
-            brand_id = brand_id,
-            sector = sector or None,
-            owner_terms = owner_terms,
-            known_domains = [root_domain]
-        )
-        return brand_id
\ No newline at end of file
+    # Cliente con gzip: el cuerpo del _bulk es grande y repetitivo
+    client = get_opensearch_bulk_client()
+
+    brand_ids: List[str] = []
+    actions = []
+    for root_domain, owner_str, brand_id_hint in items:
+        brand_id, body = _ensure_brand_update(root_domain, owner_str, sector, brand_id_hint)
+        brand_ids.append(brand_id)
+        # Varios roots de la misma brand se aplican en orden dentro del bulk:
+        # el primero la crea (upsert) y los siguientes la nutren (script)
+        actions.append({
+            "_op_type": "update",
+            "_index": INDEX_KNOWN_BRANDS,
+            "_id": brand_id,
+            **body
+        })
+
+    _, errors = helpers.bulk(client, actions, raise_on_error=False, chunk_size=500)
+    # Cada error es {"update": {"_id": ..., "status": ..., "error": ...}}
+    failed = {item.get("update", {}).get("_id") for item in errors}
+
+    # La caché de lookups se invalida igualmente: un fallo puede venir tras un update previo de la misma brand
+    for brand_id, (root_domain, _, _) in zip(brand_ids, items):
+        _invalidate_brand_lookups(brand_id, root_domain)
+
+    brand_ids = [brand_id for brand_id in brand_ids if brand_id not in failed]
+    for brand_id in dict.fromkeys(brand_ids):
+        _register_brand_grams(brand_id)
+    return brand_ids
\ No newline at end of file
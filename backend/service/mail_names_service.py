@@ -1,29 +1,23 @@
 # app/services/domain_sanitizer_service/mail_names_service.py
 
-from typing import List, Optional, Dict
+from typing import Iterable, List, Optional, Dict
+from cachetools import TTLCache, cached
 
-from opensearchpy import OpenSearch, helpers
-from opensearch_client import get_opensearch_client
+from opensearchpy import OpenSearch, NotFoundError, helpers
+from opensearch_client import get_opensearch_client_cached, get_opensearch_bulk_client, create_index_if_missing, bulk_indexing
 
 INDEX_MAIL_NAMES = "mail_names"
 
-def __get_client() -> OpenSearch:
-        return OpenSearch(
-            hosts=[{"host": "localhost", "port": "9200"}],
-            http_compress=True,
-            use_ssl=False,
-            verify_certs=False,
-            ssl_show_warn=False,
-        )
+# Caché por dominio (también los "no existe"). TTL: lo sembrado por otro worker o escrito
+# directamente en el índice se ve como mucho 5 minutos después
+_MAIL_NAME_CACHE = TTLCache(maxsize=4096, ttl=300)
 
 def ensure_mail_names_index() -> None:
     """
     Crea el índice 'mail_names' si no existe.
     Guarda proveedores personales tipo gmail.com, outlook.com, etc.
     """
-    client: OpenSearch = get_opensearch_client()
-    if client.indices.exists(index=INDEX_MAIL_NAMES):
-        return
+    client: OpenSearch = get_opensearch_client_cached()
 
     body = {
         "mappings": {
@@ -41,7 +35,8 @@ def ensure_mail_names_index() -> None:
         }
     }
 
-    client.indices.create(index=INDEX_MAIL_NAMES, body=body)
+    # Una sola petición: si el índice ya existe, OpenSearch lo rechaza y no hacemos nada
+    create_index_if_missing(client, INDEX_MAIL_NAMES, body)
 
 
 def upsert_mail_name(domain: str,
@@ -51,7 +46,7 @@ def upsert_mail_name(domain: str,
     Crea o actualiza un mail_name.
     Puedes usarlo para meter tus proveedores personales iniciales.
     """
-    client = get_opensearch_client()
+    client = get_opensearch_client_cached()
     base_name = base_name or domain.split(".")[0]
     tags = tags or ["general-supplier", "personal-mail"]
 
@@ -65,48 +60,71 @@ def upsert_mail_name(domain: str,
     }
 
     client.index(index=INDEX_MAIL_NAMES, id=doc_id, body=payload)
+    clear_mail_names_cache()
 
 
-def bulk_seed_mail_names(domains: List[str]) -> None:
+def bulk_seed_mail_names(domains: Iterable[str]) -> None:
     """
     Opcional: para cargar de golpe tus MAIL_NAMES iniciales.
+    Acepta cualquier iterable (lista, generador que lee de CSV...): se consume en streaming,
+    las acciones se generan bajo demanda y se envían con parallel_bulk (varios hilos).
     """
-    client = get_opensearch_client()
-    actions = []
-
-    for domain in domains:
-        base_name = domain.split(".")[0]
-        actions.append({
-            "_index": INDEX_MAIL_NAMES,
-            "_id": domain,
-            "_source": {
-                "domain": domain,
-                "base_name": base_name,
-                "tags": ["general-supplier", "personal-mail"]
+    # Cliente con gzip: el cuerpo del _bulk es grande y repetitivo
+    client = get_opensearch_bulk_client()
+
+    def _gen():
+        for domain in domains:
+            base_name = domain.split(".")[0]
+            yield {
+                "_index": INDEX_MAIL_NAMES,
+                "_id": domain,
+                "_source": {
+                    "domain": domain,
+                    "base_name": base_name,
+                    "tags": ["general-supplier", "personal-mail"]
+                }
             }
-        })
 
-    if actions:
-        helpers.bulk(client, actions)
+    # Sin refrescos periódicos durante la carga; parallel_bulk es perezoso: hay que consumirlo
+    with bulk_indexing(client, INDEX_MAIL_NAMES):
+        for ok, _ in helpers.parallel_bulk(client, _gen(), thread_count=4, chunk_size=1000, queue_size=4):
+            pass
+    clear_mail_names_cache()
 
 
 def get_mail_name(domain: str) -> Optional[Dict]:
     """
     Devuelve el documento de mail_names para ese dominio (si existe).
+    Cacheado en proceso con TTL (también los "no existe", ver _MAIL_NAME_CACHE);
+    las escrituras de este módulo limpian la caché.
     """
-    client = get_opensearch_client()
-
-    resp = client.search(
-        index=INDEX_MAIL_NAMES,
-        body={
-            "size": 1,
-            "query": {
-                "term": {"domain": domain}
-            }
-        }
-    )
-    hits = resp.get("hits", {}).get("hits", [])
-    return hits[0] if hits else None
+    return _get_mail_name_cached((domain or "").strip().lower())
+
+
+def clear_mail_names_cache() -> None:
+    _MAIL_NAME_CACHE.clear()
+
+
+@cached(_MAIL_NAME_CACHE)
+def _get_mail_name_cached(domain: str) -> Optional[Dict]:
+    client = get_opensearch_client_cached()
+
+    # El domain es el _id del documento (ver upsert_mail_name): GET directo, sin pasar por búsqueda
+    try:
+        return client.get(index=INDEX_MAIL_NAMES, id=domain)
+    except NotFoundError:
+        return None
+
+
+def get_mail_base_name(domain: str) -> Optional[str]:
+    """
+    base_name guardado para el proveedor ('gmail' para gmail.com), None si no es un mail_name.
+    Sale del mismo documento cacheado que is_personal_mail_domain: sin split por petición.
+    """
+    doc = get_mail_name(domain)
+    if doc is None:
+        return None
+    return (doc.get("_source") or {}).get("base_name") or domain.split(".")[0]
 
 
 def is_personal_mail_domain(domain: str) -> bool:
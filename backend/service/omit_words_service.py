@@ -4,21 +4,24 @@
 PARA QUE UNA OMIT WORD SE CARGUE, DEBE ESTAR MARCADA COMO 'active' en OpenSearch
 """
 
-from typing import List, Optional
+from typing import FrozenSet, Iterable, Iterator, List, Optional
+import orjson
+from cachetools import TTLCache
 from opensearchpy import OpenSearch, helpers
-from opensearch_client import get_opensearch_client
+from opensearch_client import get_opensearch_client_cached, get_opensearch_bulk_client, create_index_if_missing, bulk_indexing
 
 INDEX_OMIT_WORDS = "omit_words"
 
+# Omit words por active_only (lista y frozenset). Con TTL: las escrituras de otros workers (o directas
+# al índice) se ven como mucho 5 minutos después; las de este módulo limpian la caché al momento
+_OMIT_WORDS_CACHE = TTLCache(maxsize=4, ttl=300)
+
 def ensure_omit_words_index() -> None:
     """
     Crea el índice 'omit_words' si no existe.
     Guarda palabras que se deben ignorar al extraer la company del dominio.
     """
-    client = get_opensearch_client()
-
-    if client.indices.exists(index=INDEX_OMIT_WORDS):
-        return
+    client = get_opensearch_client_cached()
 
     body = {
         "mappings": {
@@ -39,7 +42,20 @@ def ensure_omit_words_index() -> None:
         }
     }
 
-    client.indices.create(index=INDEX_OMIT_WORDS, body=body)
+    # Una sola petición: si el índice ya existe, OpenSearch lo rechaza y no hacemos nada
+    create_index_if_missing(client, INDEX_OMIT_WORDS, body)
+
+
+def _omit_word_doc(word: str,
+                   lang: Optional[str] = None,
+                   scope: Optional[str] = None,
+                   active: bool = True) -> dict:
+    return {
+        "word": word,
+        "lang": lang or "mixed",
+        "scope": scope or "domain",
+        "active": active,
+    }
 
 
 def upsert_omit_word(word: str,
@@ -49,84 +65,187 @@ def upsert_omit_word(word: str,
     """
     Crea o actualiza una palabra omitible.
     Usa la propia palabra como _id para no duplicar.
+    Para muchas palabras usar bulk_upsert_omit_words (un _bulk por lote, no una petición por palabra).
     """
-    client = get_opensearch_client()
+    client = get_opensearch_client_cached()
 
     doc_id = word.lower().strip()
-    payload = {
-        "word": doc_id,
-        "lang": lang or "mixed",
-        "scope": scope or "domain",
-        "active": active,
-    }
+    payload = _omit_word_doc(doc_id, lang, scope, active)
 
     client.index(index=INDEX_OMIT_WORDS, id=doc_id, body=payload)
+    clear_omit_words_cache()
 
 
-def bulk_seed_omit_words(words: List[str]) -> None:
-    """
-    Carga inicial masiva de palabras omitibles.
-    """
-    if not words:
-        return
-
-    client = get_opensearch_client()
-    actions = []
-
+def _unique_words(words: Iterable[str]) -> Iterator[str]:
+    # Una acción por palabra normalizada: los duplicados solo reescribirían el mismo _id
+    seen = set()
     for w in words:
         w_norm = w.lower().strip()
-        actions.append({
-            "_index": INDEX_OMIT_WORDS,
-            "_id": w_norm,
-            "_source": {
-                "word": w_norm,
-                "lang": "mixed",
-                "scope": "domain",
-                "active": True,
-            }
-        })
+        if not w_norm or w_norm in seen:
+            continue
+        seen.add(w_norm)
+        yield w_norm
 
-    helpers.bulk(client, actions)
 
+def _send_ndjson(client: OpenSearch, lines: List[bytes]) -> None:
+    resp = client.bulk(body=b"\n".join(lines) + b"\n", index=INDEX_OMIT_WORDS)
+    if resp.get("errors"):
+        failed = [item for item in resp.get("items", []) if "error" in next(iter(item.values()))]
+        raise helpers.BulkIndexError(f"{len(failed)} document(s) failed to index.", failed)
 
-def get_all_omit_words(active_only: bool = True) -> List[str]:
+
+def bulk_upsert_omit_words(words: Iterable[str],
+                           lang: Optional[str] = None,
+                           scope: Optional[str] = None,
+                           active: bool = True,
+                           chunk_size: int = 5000,
+                           max_chunk_bytes: int = 50 * 1024 * 1024,
+                           thread_count: int = 1) -> None:
     """
-    Devuelve todas las palabras omitibles (por defecto solo las activas).
+    Versión por lotes de upsert_omit_word: mismo documento, enviado por _bulk.
+    Acepta cualquier iterable: las acciones se generan en streaming, sin lista intermedia.
+    chunk_size / max_chunk_bytes limitan cada _bulk (lo que se alcance antes).
+    Con thread_count=1 (por defecto) el NDJSON se serializa directamente con orjson;
+    para cargas muy grandes, thread_count > 1 reparte los lotes con parallel_bulk.
     """
+    # Cliente con gzip: el cuerpo del _bulk es grande y repetitivo
+    client = get_opensearch_bulk_client()
+
+    with bulk_indexing(client, INDEX_OMIT_WORDS):
+        if thread_count > 1:
+            actions = (
+                {
+                    "_index": INDEX_OMIT_WORDS,
+                    "_id": w,
+                    "_source": _omit_word_doc(w, lang, scope, active)
+                }
+                for w in _unique_words(words)
+            )
+            # parallel_bulk es perezoso: hay que consumirlo para que envíe algo
+            for ok, _ in helpers.parallel_bulk(
+                client,
+                actions,
+                thread_count=thread_count,
+                chunk_size=chunk_size,
+                max_chunk_bytes=max_chunk_bytes,
+                queue_size=4
+            ):
+                pass
+        else:
+            # Dos líneas por palabra, ya en bytes: sin los dicts intermedios del helper
+            lines: List[bytes] = []
+            size = 0
+            for w in _unique_words(words):
+                header = orjson.dumps({"index": {"_id": w}})
+                source = orjson.dumps(_omit_word_doc(w, lang, scope, active))
+                lines += (header, source)
+                size += len(header) + len(source) + 2
+                if len(lines) >= 2 * chunk_size or size >= max_chunk_bytes:
+                    _send_ndjson(client, lines)
+                    lines, size = [], 0
+            if lines:
+                _send_ndjson(client, lines)
+    clear_omit_words_cache()
 
-    client = get_opensearch_client()
 
+def bulk_seed_omit_words(words: Iterable[str], **bulk_kwargs) -> None:
+    """
+    Carga inicial masiva de palabras omitibles (activas, lang 'mixed', scope 'domain').
+    bulk_kwargs: chunk_size, max_chunk_bytes, thread_count (ver bulk_upsert_omit_words).
+    """
+    bulk_upsert_omit_words(words, **bulk_kwargs)
+
+
+# Solo las claves de los buckets: sin _shards, hits vacíos ni doc_count en la respuesta
+OMIT_WORDS_FILTER_PATH = "aggregations.words.buckets.key"
+
+def omit_words_search_body(active_only: bool = True) -> dict:
+    """Cuerpo de la búsqueda de get_all_omit_words (reutilizable en un _msearch)."""
     query: dict
     if active_only:
         query = {"term": {"active": True}}
     else:
         query = {"match_all": {}}
 
+    return {
+        "size": 0,
+        "query": query,
+        "aggs": {
+            "words": {
+                # tope de search.max_buckets por defecto (65535): por encima la petición falla en vez de truncar
+                "terms": {"field": "word", "size": 65535}
+            }
+        }
+    }
+
+
+def omit_words_from_response(resp: dict) -> List[str]:
+    buckets = resp.get("aggregations", {}).get("words", {}).get("buckets", [])
+    return [b["key"] for b in buckets]
+
+
+def clear_omit_words_cache() -> None:
+    _OMIT_WORDS_CACHE.clear()
+
+
+def prime_omit_words(words: List[str], active_only: bool = True) -> None:
+    """Deja en caché una lista de omit words leída fuera de este módulo (p.ej. el _msearch de arranque)."""
+    _OMIT_WORDS_CACHE[active_only] = words
+    # también el frozenset que lee recognition: la primera petición no tiene que construirlo
+    _OMIT_WORDS_CACHE[("set", active_only)] = frozenset(words)
+
+
+def get_all_omit_words(active_only: bool = True) -> List[str]:
+    """
+    Devuelve todas las palabras omitibles (por defecto solo las activas).
+    Una agregación terms sobre 'word' (sin hits): no trunca en 1000 y no viaja ningún _source.
+    Cacheado con TTL de 5 minutos (ver _OMIT_WORDS_CACHE); las escrituras de este módulo limpian la caché.
+    """
+    cached = _OMIT_WORDS_CACHE.get(active_only)
+    if cached is not None:
+        return cached
+
+    client = get_opensearch_client_cached()
+
     resp = client.search(
         index=INDEX_OMIT_WORDS,
-        body={
-            "size": 1000,    # suficiente para empezar
-            "_source": ["word"],
-            "query": query,
-        }
+        body=omit_words_search_body(active_only),
+        filter_path=OMIT_WORDS_FILTER_PATH,
+        # Misma consulta siempre: la sirve la shard request cache, y '_local' hace que caiga en las mismas copias
+        request_cache=True,
+        preference="_local"
     )
+    words = omit_words_from_response(resp)
+    _OMIT_WORDS_CACHE[active_only] = words
+    return words
+
 
-    hits = resp.get("hits", {}).get("hits", [])
-    return [h["_source"]["word"] for h in hits]
+def get_omit_words_set(active_only: bool = True) -> FrozenSet[str]:
+    """
+    Las mismas omit words como frozenset (lookup O(1) por token), con la misma caché y TTL.
+    """
+    key = ("set", active_only)
+    words = _OMIT_WORDS_CACHE.get(key)
+    if words is None:
+        words = frozenset(get_all_omit_words(active_only))
+        _OMIT_WORDS_CACHE[key] = words
+    return words
 
 
 def activate_all_omit_words():
-    client = get_opensearch_client()
+    client = get_opensearch_client_cached()
     index_name = "omit_words"
 
-    # Definimos la actualización masiva
+    # Definimos la actualización masiva: solo las que NO están ya activas (false o sin campo)
     update_body = {
         "script": {
             "source": "ctx._source.active = true",
             "lang": "painless"
         },
         "query": {
-            "match_all": {}
+            "bool": {
+                "must_not": {"term": {"active": True}}
+            }
         }
     }
 
@@ -136,11 +255,18 @@ def activate_all_omit_words():
         response = client.update_by_query(
             index=index_name, 
             body=update_body,
-            wait_for_completion=True # Esperamos a que termine para ver el resultado
+            wait_for_completion=True, # Esperamos a que termine para ver el resultado
+            slices="auto",            # en paralelo, un slice por shard
+            conflicts="proceed",      # un conflicto de versión no aborta el resto
+            requests_per_second=-1,   # sin throttling
+            refresh=False
         )
+        # Un único refresh al final en vez de uno por lote
+        client.indices.refresh(index=index_name)
         
         updated = response.get("updated", 0)
         batches = response.get("batches", 0)
+        clear_omit_words_cache()
         
         print(f"Se han activado {updated} palabras en {batches} lotes.")
         
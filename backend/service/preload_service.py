@@ -0,0 +1,41 @@
+# backend/service/preload_service.py
+
+import logging
+
+from opensearch_client import get_opensearch_client_cached
+from .omit_words_service import INDEX_OMIT_WORDS, OMIT_WORDS_FILTER_PATH, omit_words_search_body, omit_words_from_response, prime_omit_words
+from .privacy_values_service import INDEX_PRIVACY_VALUES, privacy_values_search_body, privacy_values_from_source, prime_privacy_values
+
+logger = logging.getLogger(__name__)
+
+
+def preload_reference_data() -> None:
+    """
+    Carga en caché las omit_words activas y los patrones de privacidad WHOIS
+    con un único _msearch (antes: una petición por caché en la primera llamada).
+    Si alguna de las búsquedas falla (índice vacío o inexistente), esa caché
+    se queda como estaba y se rellena bajo demanda.
+    """
+    client = get_opensearch_client_cached()
+
+    body = [
+        {"index": INDEX_OMIT_WORDS, "request_cache": True, "preference": "_local"},
+        omit_words_search_body(active_only=True),
+        {"index": INDEX_PRIVACY_VALUES},
+        privacy_values_search_body(),
+    ]
+    # filter_path recorta cada respuesta a lo que se parsea (y conserva los errores por búsqueda).
+    # 'status' siempre viene: así ninguna respuesta queda vacía y el array mantiene sus 2 posiciones
+    filter_path = f"responses.status,responses.{OMIT_WORDS_FILTER_PATH},responses.hits.hits._source,responses.error"
+    omit_resp, privacy_resp = client.msearch(body=body, filter_path=filter_path).get("responses", [{}, {}])
+
+    if "error" in omit_resp:
+        logger.warning(f"No se pudieron precargar omit_words: {omit_resp['error']}")
+    else:
+        prime_omit_words(omit_words_from_response(omit_resp), active_only=True)
+
+    if "error" in privacy_resp:
+        logger.warning(f"No se pudieron precargar privacy_values: {privacy_resp['error']}")
+    else:
+        hits = privacy_resp.get("hits", {}).get("hits", [])
+        prime_privacy_values(privacy_values_from_source(hits[0].get("_source", {})) if hits else [])
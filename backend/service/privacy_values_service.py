@@ -1,14 +1,22 @@
 # backend/service/privacy_values_service.py
 
-from typing import List
-from functools import lru_cache
+from typing import List, Optional, Tuple
 
+import ahocorasick
+from cachetools import TTLCache
 from opensearchpy import OpenSearch, NotFoundError
-from opensearch_client import get_opensearch_client
+from opensearch_client import get_opensearch_client_cached, create_index_if_missing
 
 INDEX_PRIVACY_VALUES = "privacy_values"
 DOC_ID_PRIVACY_VALUES = "whois_privacy_values"
 
+# Patrones + autómata, juntos para que nunca se desincronicen. TTL para que otros procesos
+# (o escrituras directas en OpenSearch) acaben viéndose sin consultar en cada email
+_PRIVACY_CACHE = TTLCache(maxsize=1, ttl=300)
+
+# Patrones por defecto si el documento no existe o está vacío (los que se usaban antes en legitmacy)
+DEFAULT_PRIVACY_VALUES = ("redacted", "privacy", "whoisguard", "protected", "gdpr")
+
 # ---------------------------------------------------------
 # CREACIÓN DE ÍNDICE
 # ---------------------------------------------------------
@@ -18,10 +26,7 @@ def ensure_privacy_values_index() -> None:
     Crea el índice 'privacy_values' si no existe.
     Este índice contiene un único documento con un array 'values'.
     """
-    client: OpenSearch = get_opensearch_client()
-
-    if client.indices.exists(index=INDEX_PRIVACY_VALUES):
-        return
+    client: OpenSearch = get_opensearch_client_cached()
 
     body = {
         "mappings": {
@@ -32,7 +37,8 @@ def ensure_privacy_values_index() -> None:
         }
     }
 
-    client.indices.create(index=INDEX_PRIVACY_VALUES, body=body)
+    # Una sola petición: si el índice ya existe, OpenSearch lo rechaza y no hacemos nada
+    create_index_if_missing(client, INDEX_PRIVACY_VALUES, body)
 
 
 # ---------------------------------------------------------
@@ -44,7 +50,7 @@ def upsert_privacy_values(values: List[str]) -> None:
     Inserta o actualiza el documento único con todos los patrones
     de privacidad WHOIS.
     """
-    client = get_opensearch_client()
+    client = get_opensearch_client_cached()
 
     payload = {
         "config_key": DOC_ID_PRIVACY_VALUES,
@@ -57,29 +63,77 @@ def upsert_privacy_values(values: List[str]) -> None:
         body=payload
     )
 
-    # limpiar caché
-    get_privacy_values.cache_clear()
+    # limpiar caché (valores y autómata construido a partir de ellos)
+    clear_privacy_values_cache()
 
 
 # ---------------------------------------------------------
 # LECTURA DEL DOCUMENTO ÚNICO
 # ---------------------------------------------------------
 
-@lru_cache(maxsize=1)
-def get_privacy_values() -> List[str]:
+def privacy_values_search_body() -> dict:
+    """Búsqueda por _id del documento único (equivale al GET, pero cabe en un _msearch)."""
+    return {
+        "size": 1,
+        "_source": ["values"],
+        "query": {"ids": {"values": [DOC_ID_PRIVACY_VALUES]}}
+    }
+
+
+def privacy_values_from_source(src: dict) -> List[str]:
+    arr = (src or {}).get("values", [])
+    return [str(v).lower().strip() for v in arr if v]
+
+
+def clear_privacy_values_cache() -> None:
+    _PRIVACY_CACHE.clear()
+
+
+def prime_privacy_values(values: List[str]) -> None:
+    """Deja en caché los patrones leídos fuera de este módulo (p.ej. el _msearch de arranque)."""
+    _PRIVACY_CACHE["privacy"] = _privacy_entry(values)
+
+
+def _privacy_entry(values: List[str]) -> Tuple[List[str], Optional[ahocorasick.Automaton]]:
+    # Sin documento (o vacío) no nos quedamos sin detección: patrones por defecto
+    values = values or list(DEFAULT_PRIVACY_VALUES)
+    return values, _build_automaton(values)
+
+
+def _build_automaton(patterns: List[str]) -> Optional[ahocorasick.Automaton]:
     """
-    Devuelve la lista de patrones 'values' desde el documento único.
-    Cacheado para rendimiento.
+    Autómata Aho-Corasick con todos los patrones: una sola pasada por el valor
+    WHOIS en vez de un 'in' por patrón. None si no hay patrones.
     """
-    client = get_opensearch_client()
+    if not patterns:
+        return None
+    automaton = ahocorasick.Automaton()
+    for pat in patterns:
+        automaton.add_word(pat, pat)
+    automaton.make_automaton()
+    return automaton
+
+
+def _load_privacy() -> Tuple[List[str], Optional[ahocorasick.Automaton]]:
+    cached = _PRIVACY_CACHE.get("privacy")
+    if cached is None:
+        client = get_opensearch_client_cached()
+        try:
+            doc = client.get(index=INDEX_PRIVACY_VALUES, id=DOC_ID_PRIVACY_VALUES)
+            values = privacy_values_from_source(doc.get("_source", {}))
+        except NotFoundError:
+            values = []
+        cached = _privacy_entry(values)
+        _PRIVACY_CACHE["privacy"] = cached
+    return cached
 
-    try:
-        doc = client.get(index=INDEX_PRIVACY_VALUES, id=DOC_ID_PRIVACY_VALUES)
-        src = doc.get("_source", {})
-        arr = src.get("values", [])
-        return [str(v).lower().strip() for v in arr if v]
-    except NotFoundError:
-        return []
+
+def get_privacy_values() -> List[str]:
+    """
+    Devuelve la lista de patrones 'values' desde el documento único (DEFAULT_PRIVACY_VALUES si no hay).
+    Cacheado para rendimiento (TTL de 5 minutos, ver _PRIVACY_CACHE).
+    """
+    return _load_privacy()[0]
 
 
 # ---------------------------------------------------------
@@ -93,6 +147,7 @@ def is_privacy_value(val: str) -> bool:
     if not val:
         return False
 
-    v = val.lower()
-    patterns = get_privacy_values()
-    return any(pat in v for pat in patterns)
+    automaton = _load_privacy()[1]
+    if automaton is None:
+        return False
+    return next(automaton.iter(val.lower()), None) is not None
@@ -1,47 +1,53 @@
 # backend/service/sanitize_email.py
 
+import os
 import re
 import uuid
 import asyncio
-import tldextract
+from .utils.domain import tld_extract
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Union
 from .utils.email_utils import validate_mail, extract_domain_from_email
 from .utils.legitmacy import get_domain_owner
 from .utils.recognition import extract_company_from_domain
-from known_brands_v3_service import find_brand_by_known_domain, ensure_brand_for_root_domain, add_known_domain, add_owner_terms
-from .mail_names_service import is_personal_mail_domain
-from Levenshtein import distance
+from .known_brands_v3_service import find_brand_by_any_domain, ensure_brand_for_root_domain, add_known_domain, add_owner_terms, _tokenize_str
+from .mail_names_service import get_mail_base_name
+from rapidfuzz.distance import Levenshtein
 
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Patrones precompilados (sanitize_mail se ejecuta en cada email)
+_NOREPLY_RE = re.compile(r"\bno[\-_]?reply\b", re.IGNORECASE)
+# _norm_owner: fuera comas, puntos a espacio, en una sola pasada
+_OWNER_TRANS = str.maketrans({",": None, ".": " "})
+
+# WHOIS especulativo del root DNS real: se lanza antes de buscar la brand y se cancela si al final
+# no hace falta. Desactivado por defecto porque puede aumentar la carga sobre los proveedores WHOIS
+_SPECULATIVE_WHOIS = os.getenv("SANITIZE_SPECULATIVE_WHOIS", "0") == "1"
+
 # ------------------ Helpers ---------------------
 def _norm_owner(s: str) -> str:
     if not s:
         return ""
-    s = s.lower().replace(",", "").replace(".", " ")
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    # split() sin argumentos ya colapsa cualquier espacio en blanco y recorta los extremos
+    return " ".join(s.lower().translate(_OWNER_TRANS).split())
+
+# owner_terms de una brand se repite en todos sus correos: memo del set de tokens por string
+# (misma lógica que en known_brands_service, _tokenize_str importado a nivel de módulo)
+@lru_cache(maxsize=10_000)
+def _owner_token_set(s: str) -> FrozenSet[str]:
+    return frozenset(_tokenize_str(s))
 
 def _owners_token_overlap(a: str, b: str) -> float:
     """
     Similitud a nivel de tokens WHOIS/owner_terms.
     Devuelve 1.0 si todos los tokens del más corto están contenidos en el más largo.
     """
-    # usamos la misma lógica que en known_brands_service
-    try:
-        from .known_brands_v3_service import _tokenize_str
-    except ImportError:
-        # fallback mínimo si cambia el import
-        def _tokenize_str(s: str) -> list[str]:
-            s = (s or "").lower()
-            s = re.sub(r"[,\.]", " ", s)
-            s = re.sub(r"\s+", " ", s).strip()
-            return s.split() if s else []
-
-    tokens_a = set(_tokenize_str(a))
-    tokens_b = set(_tokenize_str(b))
+    tokens_a = _owner_token_set(a)
+    tokens_b = _owner_token_set(b)
 
     if not tokens_a or not tokens_b:
         return 0.0
@@ -54,34 +60,52 @@ def _owners_token_overlap(a: str, b: str) -> float:
     # si todos los tokens del más corto están contenidos en el otro → 1.0
     return len(inter) / float(min_len)
 
-def _owners_similarity(a: str, b: str) -> float:
-    """Devuelve similitud [0–1] usando Levenshtein normalizado."""
+def _owners_similarity(a: str, b: str, score_cutoff: float = 0.0) -> float:
+    """
+    Devuelve similitud [0–1] usando Levenshtein normalizado.
+    Si no puede llegar a score_cutoff devuelve 0.0 (sin calcular la distancia cuando las longitudes ya lo descartan).
+    """
     a_n = _norm_owner(a).replace(" ", "")
     b_n = _norm_owner(b).replace(" ", "")
     if not a_n or not b_n:
         return 0.0
-    sim = 1.0 - (distance(a_n, b_n) / max(len(a_n), len(b_n)))
-    return max(0.0, min(1.0, sim))
+    # Owners idénticos (caso habitual al revalidar la misma marca): sin cálculo de distancia
+    if a_n == b_n:
+        return 1.0
+    # La diferencia de longitudes es cota inferior de la distancia → cota superior de la similitud
+    la, lb = len(a_n), len(b_n)
+    if 1.0 - abs(la - lb) / max(la, lb) < score_cutoff:
+        return 0.0
+    # 1 - distancia / longitud máxima, calculado entero en C
+    return Levenshtein.normalized_similarity(a_n, b_n, score_cutoff=score_cutoff)
+
+async def _owner_with_retries(domain: str) -> str:
+    """WHOIS owner con hasta 2 reintentos espaciados si no se encuentra (dentro de get_domain_owner, antes de cachear)."""
+    return await get_domain_owner(domain, retries=2)
 
 def _norm_domain(d: str) -> str:
     return (d or "").strip().lower().rstrip(".")
 
 def _is_subdomain(child: str, parent: str) -> bool:
+    # comparación por etiquetas (de derecha a izquierda): evilbancosantander.es NO es subdominio de bancosantander.es
     c = _norm_domain(child)
     p = _norm_domain(parent)
-    return bool(p) and c.endswith(p) and c != p
+    return bool(p) and c.endswith("." + p)
 
 async def sanitize_mail(email):
+    # Un único id por invocación, compartido por todas las salidas (formato UUID con guiones, como hasta ahora)
+    request_id = str(uuid.uuid4())
+
     # 1. Validar y normalizar el email
     v_mail = validate_mail(email.strip().lower())
 
     if not v_mail:
         # Permitir no-reply raros, como tenías
-        if re.search(r"\bno[\-_]?reply\b", email, re.IGNORECASE):
+        if _NOREPLY_RE.search(email):
             v_mail = email
         else:
             return {
-                "request_id": str(uuid.uuid4()),
+                "request_id": request_id,
                 "email": email,
                 "veredict": "phishing",
                 "veredict_detail": "The domain name does not exist",
@@ -102,7 +126,7 @@ async def sanitize_mail(email):
         except ValueError:
             # Por si acaso, si algo raro pasa, mantenemos el comportamiento antiguo
             return {
-                "request_id": str(uuid.uuid4()),
+                "request_id": request_id,
                 "email": email,
                 "veredict": "phishing",
                 "veredict_detail": "Ascii anomaly detected",
@@ -122,7 +146,7 @@ async def sanitize_mail(email):
         else:
             # comportamiento original: anomalía ASCII
             return {
-                "request_id": str(uuid.uuid4()),
+                "request_id": request_id,
                 "email": email,
                 "veredict": "phishing",
                 "veredict_detail": "Ascii anomaly detected",
@@ -137,7 +161,7 @@ async def sanitize_mail(email):
     incoming_domain = extract_domain_from_email(v_mail)
     if not incoming_domain:
         return {
-            "request_id": str(uuid.uuid4()),
+            "request_id": request_id,
             "email": email,
             "veredict": "phishing",
             "veredict_detail": "Invalid email format",
@@ -148,17 +172,18 @@ async def sanitize_mail(email):
             "evidences": [],
         }
 
-    # 2.1 Proveedor generalista (mail_names en OpenSearch)
-    if is_personal_mail_domain(incoming_domain):
+    # 2.1 Proveedor generalista (mail_names en OpenSearch); la etiqueta es su base_name ya precalculado
+    mail_base_name = get_mail_base_name(incoming_domain)
+    if mail_base_name is not None:
         return {
-            "request_id": str(uuid.uuid4()),
+            "request_id": request_id,
             "email": email,
             "veredict": "valid",
             "veredict_detail": "General-supplier's domain",
             "company_impersonated": None,
             "company_detected": None,
             "confidence": 1.0,
-            "labels": [incoming_domain.split(".")[0], "general-supplier"],
+            "labels": [mail_base_name, "general-supplier"],
             "evidences": [],
         }
 
@@ -166,7 +191,7 @@ async def sanitize_mail(email):
     # 3. DETECCIÓN DE BRAND, ROOT LÓGICO Y ROOT DNS REAL
     # ======================================================
 
-    ext = tldextract.extract(incoming_domain)
+    ext = tld_extract(incoming_domain)
 
     # root DNS real: respeta SIEMPRE el sufijo completo (com.es, com.mx, etc.)
     if ext.domain and ext.suffix:
@@ -174,6 +199,14 @@ async def sanitize_mail(email):
     else:
         dns_root_domain = incoming_domain
 
+    incoming_owner_task = None
+    if _SPECULATIVE_WHOIS:
+        incoming_owner_task = asyncio.create_task(_owner_with_retries(dns_root_domain))
+        # si nadie la espera (excepción más abajo), que no quede un error sin recoger
+        incoming_owner_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        # cedemos el loop una vez para que la petición WHOIS arranque antes de las consultas a OpenSearch
+        await asyncio.sleep(0)
+
     # 3.1 Heurística para sacar "company base" (usa omit_words y OpenSearch)
     domain_info = extract_company_from_domain(incoming_domain)
     base_company = domain_info["_id"] or None  # ej: "bancosantander"
@@ -201,24 +234,20 @@ async def sanitize_mail(email):
     brand_profile = ""
     brand_known_domains = set()
     root_owner = None
+    prefetched_incoming_owner = None
     owner_terms = ""
 
     # 3.3 Primero: comprobar si el dominio entrante YA es conocido
-    brand_doc = find_brand_by_known_domain(incoming_domain) # xxxGestionar aquí sensibilidad dominio/subdominio
-    if not brand_doc and dns_root_domain != incoming_domain:
-        # también probamos contra el root DNS real (bancosantander-mail.es)
-        brand_doc = find_brand_by_known_domain(dns_root_domain)
+    # (una sola búsqueda: dominio entrante con prioridad, y si no el root DNS real, p.ej. bancosantander-mail.es)
+    brand_doc = find_brand_by_any_domain([incoming_domain, dns_root_domain]) # xxxGestionar aquí sensibilidad dominio/subdominio
 
     # Seguridad extra: si el dominio que buscamos NO está realmente en known_domains,
     # descartamos el brand_doc (por si OpenSearch devolviese algo raro).
     if brand_doc:
         src_tmp = brand_doc["_source"]
-        kd_tmp = set(src_tmp.get("known_domains", []))
-        norm_incoming = _norm_domain(incoming_domain)
-        norm_dns_root = _norm_domain(dns_root_domain)
-        norm_known = {_norm_domain(d) for d in kd_tmp}
+        norm_known = {_norm_domain(d) for d in src_tmp.get("known_domains", [])}
 
-        if norm_incoming not in norm_known and norm_dns_root not in norm_known:
+        if _norm_domain(incoming_domain) not in norm_known and _norm_domain(dns_root_domain) not in norm_known:
             brand_doc = None
 
 
@@ -253,13 +282,18 @@ async def sanitize_mail(email):
             new_brand = True
             # 3.5 No existe brand aún en OpenSearch para este root_domain lógico
             # Aquí SÍ hacemos WHOIS del root_domain lógico (bancosantander.es)
-            root_owner = await get_domain_owner(root_domain)
-            t = 0.5
-            c = 0
-            while root_owner == "No encontrado" and c < 2:
-                await asyncio.sleep(1+t)
-                root_owner = await get_domain_owner(root_domain)
-                c += 1
+            if dns_root_domain != root_domain:
+                # El root DNS real nunca estará en known_domains de una brand recién creada:
+                # su WHOIS (paso 4) hará falta seguro, así que lo lanzamos en paralelo
+                root_owner, prefetched_incoming_owner = await asyncio.gather(
+                    _owner_with_retries(root_domain),
+                    incoming_owner_task or _owner_with_retries(dns_root_domain)
+                )
+            elif incoming_owner_task is not None:
+                # Mismo dominio: el WHOIS especulativo ya es el del root lógico
+                root_owner = await incoming_owner_task
+            else:
+                root_owner = await _owner_with_retries(root_domain)
 
             if root_owner != "No encontrado":
                 brand_id = ensure_brand_for_root_domain(
@@ -293,6 +327,8 @@ async def sanitize_mail(email):
 
     # Caso 1: el root DNS real YA está en known_domains ⇒ es oficial
     if brand_id and dns_root_domain in brand_known_domains:
+        if incoming_owner_task is not None:
+            incoming_owner_task.cancel()  # no hace falta: no-op si ya terminó
         owners_match = True
         similarity = 1.0
         if root_owner:
@@ -300,14 +336,13 @@ async def sanitize_mail(email):
         else:
             incoming_owner = "Dominio Previamente Autorizado"
     else:
-        # Caso 2: no está en known_domains ⇒ hacemos WHOIS del root DNS real
-        incoming_owner = await get_domain_owner(dns_root_domain)
-        t = 0.5
-        c = 0
-        while incoming_owner == "No encontrado" and c < 2:
-            await asyncio.sleep(1+t)
-            incoming_owner = await get_domain_owner(dns_root_domain)
-            c+=1
+        # Caso 2: no está en known_domains ⇒ hacemos WHOIS del root DNS real (si no se lanzó ya en 3.5)
+        if prefetched_incoming_owner is not None:
+            incoming_owner = prefetched_incoming_owner
+        elif incoming_owner_task is not None:
+            incoming_owner = await incoming_owner_task
+        else:
+            incoming_owner = await _owner_with_retries(dns_root_domain)
 
         owners_match = False
         similarity = 0.0
@@ -315,8 +350,9 @@ async def sanitize_mail(email):
         if incoming_owner != "No encontrado" and brand_id and (brand_profile or owner_terms):
             profile_for_similarity = owner_terms if owner_terms else brand_profile
 
-            sim_lev = _owners_similarity(profile_for_similarity, incoming_owner)
+            # Primero el solape de tokens (barato): Levenshtein solo cuenta si lo supera
             sim_tok = _owners_token_overlap(profile_for_similarity, incoming_owner)
+            sim_lev = _owners_similarity(profile_for_similarity, incoming_owner, score_cutoff=sim_tok) if sim_tok < 1.0 else 0.0
             similarity = max(sim_lev, sim_tok)
 
             if similarity >= 0.7:  # umbral ajustable
@@ -449,7 +485,7 @@ async def sanitize_mail(email):
         company_impersonated = company_detected
 
     return {
-        "request_id": str(uuid.uuid4()),
+        "request_id": request_id,
         "email": email,
         "veredict": veredict,
         "veredict_detail": veredict_detail,
@@ -460,5 +496,23 @@ async def sanitize_mail(email):
         "evidences": evidences,
     }
 
+async def sanitize_mails(emails: List[str], concurrency: int = 8) -> List[Union[Dict[str, Any], BaseException]]:
+    """
+    Versión por lotes de sanitize_mail: como mucho `concurrency` emails a la vez,
+    compartiendo las cachés de WHOIS/OpenSearch del proceso.
+    Los emails repetidos se procesan una sola vez. Devuelve un resultado por email,
+    en el mismo orden; si uno falla, en su posición va la excepción.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _run(e):
+        async with sem:
+            return await sanitize_mail(e)
+
+    unique = list(dict.fromkeys(emails))
+    results = await asyncio.gather(*(_run(e) for e in unique), return_exceptions=True)
+    by_email = dict(zip(unique, results))
+    return [by_email[e] for e in emails]
+
 if __name__ == "__main__":
     print(asyncio.run(sanitize_mail("test@athletic-club.eus")))
\ No newline at end of file
@@ -1,16 +1,19 @@
 # app/services/domain_sanitizer_service/service.py
 
-from .sanitize_email import sanitize_mail
+from .sanitize_email import sanitize_mail, sanitize_mails
 from .known_brands_v3_service import ensure_known_brands_v3_index, upsert_brand
 from .mail_names_service import ensure_mail_names_index
 from .omit_words_service import ensure_omit_words_index
 from .privacy_values_service import ensure_privacy_values_index
+from .preload_service import preload_reference_data
 
 class DomainSanitizerService:
 
     sanitize_mail = staticmethod(sanitize_mail)
+    sanitize_mails = staticmethod(sanitize_mails)
     ensure_known_brands_index = staticmethod(ensure_known_brands_v3_index)
     upsert_brand = staticmethod(upsert_brand)
     ensure_mail_names_index = staticmethod(ensure_mail_names_index)
     ensure_omit_words_index = staticmethod(ensure_omit_words_index)
-    ensure_privacy_values_index = staticmethod(ensure_privacy_values_index)
\ No newline at end of file
+    ensure_privacy_values_index = staticmethod(ensure_privacy_values_index)
+    preload_reference_data = staticmethod(preload_reference_data)
\ No newline at end of file
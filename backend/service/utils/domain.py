@@ -0,0 +1,11 @@
+# app/backend/service/utils/domain.py
+
+import tldextract
+from functools import lru_cache
+
+# Extractor único para todo el proceso, con la PSL empaquetada (sin red)
+_TLD_EXTRACT = tldextract.TLDExtract(suffix_list_urls=())
+_TLD_EXTRACT("example.com")  # carga la PSL al importar, fuera del camino de la petición
+
+# Memo por dominio: los remitentes se repiten mucho
+tld_extract = lru_cache(maxsize=50_000)(_TLD_EXTRACT.__call__)
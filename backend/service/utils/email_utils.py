@@ -1,13 +1,19 @@
 # app/backend/service/utils/email_utils.py
 
+from functools import lru_cache
 from email_validator import validate_email, caching_resolver, EmailNotValidError
 
+# Resolver único para todo el proceso: su caché DNS sobrevive entre llamadas
+_DNS_RESOLVER = caching_resolver(timeout=10)
+
 # checks if mail is a real direction
 def validate_mail(mail):
-    try:
-        resolver = caching_resolver(timeout=10)
+    return _validate_mail_cached(mail)
 
-        emailinfo = validate_email(mail, dns_resolver=resolver, check_deliverability=False)
+@lru_cache(maxsize=8192)
+def _validate_mail_cached(mail):
+    try:
+        emailinfo = validate_email(mail, dns_resolver=_DNS_RESOLVER, check_deliverability=False)
         email = emailinfo.normalized
         return email
 
@@ -1,34 +1,121 @@
 # app/backend/service/utils/legitmacy.py
 
-import tldextract
+import asyncio
+from service.utils.domain import tld_extract
+from typing import Dict, FrozenSet, Optional
+from cachetools import TTLCache
 from whoare.service.service import WhoareService
 from service.ascii_cctld_service import get_fallback_by_id
 from service.ascii_geotld_service import get_country_by_id
+from service.privacy_values_service import DEFAULT_PRIVACY_VALUES, is_privacy_value
 import logging
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Respaldo si no se pueden leer los patrones de privacy_values
+PRIVACY_KEYWORDS = DEFAULT_PRIVACY_VALUES
+
+# Caché de titulares WHOIS por dominio. Los "sin titular" caducan antes para poder reintentar pronto
+_OWNER_CACHE = TTLCache(maxsize=10_000, ttl=3600)
+_OWNER_MISS_CACHE = TTLCache(maxsize=10_000, ttl=300)
+_MISSING = object()
+
+# Single-flight: una sola consulta WHOIS en vuelo por dominio; el resto espera la misma task
+_OWNER_INFLIGHT: Dict[str, "asyncio.Task"] = {}
+
 
 def _is_privacy_value(word: str) -> bool:
-    privacy_keywords = ["redacted", "privacy", "whoisguard", "protected", "gdpr"]
+    # Patrones de privacy_values (autómata Aho-Corasick cacheado); si OpenSearch falla, los de siempre
     word_lower = str(word).lower()
-    is_private = any(keyword in word_lower for keyword in privacy_keywords)
-    if not is_private:
-        return False
-    return True
+    try:
+        return is_privacy_value(word_lower)
+    except Exception as e:
+        logger.warning(f"privacy_values no disponible, usando PRIVACY_KEYWORDS: {e}")
+        return any(keyword in word_lower for keyword in PRIVACY_KEYWORDS)
+
+def clear_domain_owner_cache() -> None:
+    _OWNER_CACHE.clear()
+    _OWNER_MISS_CACHE.clear()
 
-async def get_domain_owner(domain: str) -> str:
+async def get_domain_owner(domain: str, retries: int = 0) -> Optional[str]:
     """
     Devuelve el titular del dominio.
+    Cacheado por dominio (ver _OWNER_CACHE / _OWNER_MISS_CACHE); los errores no se cachean.
+    Llamadas concurrentes al mismo dominio comparten una única consulta (_OWNER_INFLIGHT).
+    retries: reintentos espaciados contra WHOIS si sale "No encontrado" (antes de cachear el fallo).
     """
     domain = (domain or "").strip().lower()
+    if not domain:
+        return "No encontrado"
+
+    # sentinel: None también es un resultado cacheable ("sin titular")
+    cached = _OWNER_CACHE.get(domain, _MISSING)
+    if cached is _MISSING:
+        cached = _OWNER_MISS_CACHE.get(domain, _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    task = _OWNER_INFLIGHT.get(domain)
+    if task is None:
+        # sin await entre el get y el alta: en el event loop no hace falta lock
+        task = asyncio.ensure_future(_fetch_and_cache_owner(domain, retries))
+        _OWNER_INFLIGHT[domain] = task
+        task.add_done_callback(lambda t: _release_inflight(domain, t))
+
+    # shield: cancelar a un llamante (p.ej. WHOIS especulativo) no cancela a los demás
+    return await asyncio.shield(task)
+
+def _release_inflight(domain: str, task: "asyncio.Task") -> None:
+    if _OWNER_INFLIGHT.get(domain) is task:
+        del _OWNER_INFLIGHT[domain]
+    # marca la excepción como recuperada aunque todos los llamantes se hayan cancelado
+    if not task.cancelled():
+        task.exception()
+
+async def _fetch_and_cache_owner(domain: str, retries: int = 0) -> Optional[str]:
+    # Los reintentos van contra WHOIS (sin caché); solo se cachea el resultado final
+    owner = await _fetch_domain_owner(domain)
+    c = 0
+    while owner == "No encontrado" and c < retries:
+        await asyncio.sleep(1.5)
+        owner = await _fetch_domain_owner(domain)
+        c += 1
+
+    if owner and owner != "No encontrado":
+        _OWNER_CACHE[domain] = owner
+    elif owner is None or retries > 0:
+        # "No encontrado" sin reintentos no se cachea: otro llamante con reintentos debe poder ir a WHOIS
+        _OWNER_MISS_CACHE[domain] = owner
+    return owner
+
+async def _fallback_owner(domain: str, visited: FrozenSet[str]) -> Optional[str]:
+    """
+    Titular de un dominio de fallback (.country_code, ccTLD alternativos).
+    No pasa por _OWNER_INFLIGHT: un ciclo A→B→A se esperaría a sí mismo. Con visited se corta el ciclo.
+    """
+    domain = (domain or "").strip().lower()
+    if not domain or domain in visited:
+        return None
+
+    cached = _OWNER_CACHE.get(domain, _MISSING)
+    if cached is not _MISSING:
+        return cached
+    return await _fetch_domain_owner(domain, visited)
+
+async def _fetch_domain_owner(domain: str, visited: FrozenSet[str] = frozenset()) -> Optional[str]:
+    """
+    Consulta WHOIS real del titular (sin caché).
+    visited: dominios ya recorridos en la cadena de fallbacks.
+    """
     logger.debug(f"Fetching owner for domain: {domain}")
 
     if not domain:
         return "No encontrado"
 
-    ext = tldextract.extract(domain)
+    visited = visited | {domain}
+
+    ext = tld_extract(domain)
 
     # Dominio raíz normalizado (por si te pasan subdominios)
     if ext.domain and ext.suffix:
@@ -62,7 +149,7 @@ async def get_domain_owner(domain: str) -> str:
         if not registrant_org and not registrant_name:
             country = whoare_doc.get("country").lower()
             fallback_domain = f"{ext.domain}.{country.strip()}".lower()
-            registrant = await get_domain_owner(fallback_domain)
+            registrant = await _fallback_owner(fallback_domain, visited)
             return registrant
         else:
             if registrant_org:
@@ -96,7 +183,7 @@ async def get_domain_owner(domain: str) -> str:
                 country = get_country_by_id(tld)
                 if country:
                     fallback_domain = f"{ext.domain}.{country.strip()}".lower()
-                    registrant = await get_domain_owner(fallback_domain)
+                    registrant = await _fallback_owner(fallback_domain, visited)
                     if registrant:
                         return registrant
                 return None
@@ -109,7 +196,7 @@ async def get_domain_owner(domain: str) -> str:
                     if code:
                         fallback_domain = f"{ext.domain}.{code.strip()}".lower()
 
-                        registrant = await get_domain_owner(fallback_domain)
+                        registrant = await _fallback_owner(fallback_domain, visited)
                         if registrant:
                             return registrant
 
@@ -118,7 +205,7 @@ async def get_domain_owner(domain: str) -> str:
                 if fallback:
                     for cc in fallback:
                         fallback_domain = f"{ext.domain}.{cc}".lower()
-                        registrant = await get_domain_owner(fallback_domain)
+                        registrant = await _fallback_owner(fallback_domain, visited)
 
                         if registrant:
                             break
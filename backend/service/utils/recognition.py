@@ -1,70 +1,63 @@
 # app/backend/service/utils/reecognition.py
 
-from typing import Dict
-import tldextract
+import re
+from typing import Dict, FrozenSet
+from service.utils.domain import tld_extract
+from cachetools import TTLCache, cached
 from service.known_brands_v3_service import identify_brand_by_similarity
-from service.omit_words_service import get_all_omit_words
+from service.omit_words_service import get_omit_words_set
 import logging
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-OMIT_WORDS_CACHE = set()
-OMIT_WORDS_LOADED = False
+# Términos de un dominio: todo lo que no sea punto, guion o espacio (sin tokens vacíos)
+_TOKEN_RE = re.compile(r"[^.\-\s]+")
 
+# Caché por dominio. Las brands se crean/enriquecen en caliente, por eso TTL y no lru_cache puro
+_COMPANY_CACHE = TTLCache(maxsize=4096, ttl=300)
 
-def _load_omit_words_cache():
+
+def _omit_words() -> FrozenSet[str]:
     """
-    Carga las omit_words desde OpenSearch solo una vez.
-    Si no se puede conectar, deja el set vacío y no rompe el arranque.
+    Omit words vigentes (caché con TTL en omit_words_service: se ven las escrituras de otros workers).
+    Si OpenSearch no responde, set vacío para esta llamada y no rompe; la siguiente lo reintenta.
     """
-    global OMIT_WORDS_CACHE, OMIT_WORDS_LOADED
-    if OMIT_WORDS_LOADED:
-        return
-
     try:
-        words = get_all_omit_words()
-        OMIT_WORDS_CACHE = set(words)
-        OMIT_WORDS_LOADED = True
+        return get_omit_words_set()
     except Exception as e:
-        # Aquí podrías loguear si quieres, pero NO rompas el arranque
-        # print(f"[WARN] No se pudieron cargar omit_words: {e}")
-        OMIT_WORDS_CACHE = set()
-        OMIT_WORDS_LOADED = True  # marcamos como "intentado" para no buclear
-
-def _is_omit_word(word: str) -> bool:
-    if not OMIT_WORDS_LOADED:
-        _load_omit_words_cache()
-    return word in OMIT_WORDS_CACHE
+        logger.warning(f"No se pudieron cargar omit_words: {e}")
+        return frozenset()
 
 def extract_company_from_domain(domain: str) -> Dict:
     """
     Identifica una empresa filtrando primero el ruido (omit_words) 
     y luego usando la lógica de similitud V3.
+    Los resultados se cachean por dominio (ver _COMPANY_CACHE).
     """
-    ext = tldextract.extract(domain)
+    brand_data = _extract_company_cached((domain or "").strip().lower())
+    # copia superficial para que el llamador no pueda mutar la entrada cacheada
+    return dict(brand_data) if brand_data else None
+
+def clear_company_cache() -> None:
+    _COMPANY_CACHE.clear()
+
+@cached(_COMPANY_CACHE)
+def _extract_company_cached(domain: str) -> Dict:
+    ext = tld_extract(domain)
     subd_tokens = []
     tokens = []
 
-    def _split_tokens(raw: str, sub=False):
-        # Separar por puntos y guiones para identificar términos individuales
-        for part in raw.replace("-", ".").split("."):
-            p = part.strip().lower()
-            if p:
-                if sub:
-                    subd_tokens.append(p)
-                else:
-                    tokens.append(p)
-
     # 1. Extraer partes del dominio (subdominio + dominio base)
+    # Separar por puntos y guiones para identificar términos individuales
     if ext.subdomain and ext.subdomain != "www":
-        _split_tokens(ext.subdomain, sub=True)
+        subd_tokens = _TOKEN_RE.findall(ext.subdomain.lower())
     if ext.domain:
-        _split_tokens(ext.domain)
+        tokens = _TOKEN_RE.findall(ext.domain.lower())
 
-    # 2. Filtrar omit words (mail, info, emailing, etc.)
-    filtered = [t for t in tokens if not _is_omit_word(t)]
-    filtered += [t for t in tokens if t not in filtered and not _is_omit_word(t)]
+    # 2. Filtrar omit words (mail, info, emailing, etc.): una sola pasada con lookup O(1) por token
+    omit_words = _omit_words()
+    filtered = [t for t in tokens if t not in omit_words]
 
     # Si después de filtrar no queda nada, usamos el dominio base como fallback
     if not filtered:
@@ -14,6 +14,12 @@ import json
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Patrones precompilados (se usan en cada respuesta WHOIS)
+_ANSI_RE = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
+_HTML_RE = re.compile(r"<[^>]+>")
+_NOMBRE_KEY_RE = re.compile(r"^(Nombre)(\s*:\s*)(.*)$")
+_KEY_VALUE_RE = re.compile(r"^([^:]+):\s*(.*)$")
+
 
 # ---------- helpers ----------
 def _dump_short(obj: Any, n: int = 800) -> str:
@@ -29,8 +35,8 @@ def _clean_text(text: str) -> str:
     """Normaliza saltos de línea, elimina códigos ANSI y etiquetas HTML"""
     if not text:
         return ""
-    text = re.sub(r"\x1B\[[0-?]*[ -/]*[@-~]", "", text)
-    text = re.sub(r"<[^>]+>", "", text)
+    text = _ANSI_RE.sub("", text)
+    text = _HTML_RE.sub("", text)
     text = text.replace("&nbsp;", " ")
     text = text.replace("\r\n", "\n").replace("\r", "\n")
     return text
@@ -85,10 +91,9 @@ def enumerate_nombre_keys_esnic(text: str) -> str:
     lines = text.splitlines()
     out = []
     count = 0
-    pattern = re.compile(r"^(Nombre)(\s*:\s*)(.*)$")
 
     for line in lines:
-        m = pattern.match(line.strip())
+        m = _NOMBRE_KEY_RE.match(line.strip())
         if m:
             count += 1
             new_key = f"Nombre_{count}"
@@ -111,7 +116,7 @@ def whois_to_json(whois_text: str) -> Dict[str, Any]:
         if not line:
             continue
 
-        m = re.match(r"^([^:]+):\s*(.*)$", line)
+        m = _KEY_VALUE_RE.match(line)
         if m:
             key = m.group(1).strip()
             val = m.group(2).strip() or None
@@ -145,11 +150,16 @@ class DonDominioAsync:
         verify_tls: bool = True,
         lang_path: str = "/es/whois/",
         debug: bool = False,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        cookies: Optional[httpx.Cookies] = None,
     ):
         self.timeout = timeout
         self.verify_tls = verify_tls
         self.lang_path = lang_path
         self.debug = debug
+        # transport compartido (pool de conexiones de otro dueño) y cookies de una sesión previa
+        self.transport = transport
+        self.cookies = cookies
 
         # Cabeceras anti-fingerprinting actualizadas
         self.headers = {
@@ -178,22 +188,32 @@ class DonDominioAsync:
             verify=self.verify_tls,
             http2=True,
             follow_redirects=True,
+            transport=self.transport,
+            cookies=self.cookies,
         )
         return self
 
     async def __aexit__(self, *exc):
         if self._c:
-            await self._c.aclose()
+            # Con transport compartido no se cierra: aclose() cerraría también el del resto
+            if self.transport is None:
+                await self._c.aclose()
             self._c = None
 
+    def reset_session(self):
+        """Descarta las cookies para que el siguiente warm-up abra sesión nueva"""
+        if self._c:
+            self._c.cookies.clear()
+
     # ---------- sesión/warm-up (NUEVA LÓGICA) ----------
     async def _warm_up(self, domain: str):
         """Secuencia completa: Activa la sesión, inicia búsqueda, extrae ID y hace polling"""
         assert self._c is not None
         
-        # 1. Preparar cookies
-        await self._c.get(self.lang_path)
-        await self._c.get("/v3/user/status/")
+        # 1. Preparar cookies (solo si la sesión aún no tiene PHPSESSID)
+        if not self._c.cookies.get("PHPSESSID"):
+            await self._c.get(self.lang_path)
+            await self._c.get("/v3/user/status/")
         
         # 2. El botón de encendido del backend
         r_recap = await self._c.post("/v3/recaptcha/", data={"section": "whois"})
@@ -317,12 +337,50 @@ async def get_whois_json_via_dondominio(api: DonDominioAsync, domain: str) -> Di
 
     return result
 
+# ---------- transporte y sesiones compartidas ----------
+# Un único pool de conexiones (TLS/HTTP2) para todo el proceso. Cada WHOIS usa su propio
+# AsyncClient con su propio tarro de cookies: el flujo recaptcha/search/polling va ligado a la
+# PHPSESSID, así que dos consultas en paralelo no pueden compartir sesión.
+# Las sesiones ya calentadas se guardan en _SESSIONS y se reutilizan (una por consulta en vuelo).
+_TRANSPORT: Optional[httpx.AsyncHTTPTransport] = None
+_TRANSPORT_LOCK = asyncio.Lock()
+_SESSIONS: List[httpx.Cookies] = []
+_MAX_SESSIONS = 8
+
+async def _get_transport() -> httpx.AsyncHTTPTransport:
+    global _TRANSPORT
+    async with _TRANSPORT_LOCK:
+        if _TRANSPORT is None:
+            _TRANSPORT = httpx.AsyncHTTPTransport(http2=True, verify=True)
+    return _TRANSPORT
+
+async def aclose_api() -> None:
+    global _TRANSPORT
+    async with _TRANSPORT_LOCK:
+        _SESSIONS.clear()
+        if _TRANSPORT is not None:
+            await _TRANSPORT.aclose()
+            _TRANSPORT = None
+
 async def main(domain):
-    async with DonDominioAsync(debug=True) as api:
+    transport = await _get_transport()
+    # Sesión libre del pool (sin PHPSESSID compartida con otra consulta en vuelo) o una nueva
+    cookies = _SESSIONS.pop() if _SESSIONS else None
+    async with DonDominioAsync(debug=False, transport=transport, cookies=cookies) as api:
+        had_session = bool(api._c.cookies.get("PHPSESSID"))
         info = await get_whois_json_via_dondominio(api=api, domain=domain)
-        p = info['parsed']
-        print(json.dumps(p, indent=2, ensure_ascii=False))
-        return p
+        if not info["raw_text"] and had_session:
+            # La PHPSESSID reutilizada puede haber caducado: sesión nueva y un único reintento
+            logger.debug("[main] WHOIS vacío con sesión reutilizada, reintentando con sesión nueva")
+            api.reset_session()
+            info = await get_whois_json_via_dondominio(api=api, domain=domain)
+
+        # Devolvemos la sesión al pool solo si quedó válida
+        if info["raw_text"] and api._c.cookies.get("PHPSESSID") and len(_SESSIONS) < _MAX_SESSIONS:
+            _SESSIONS.append(api._c.cookies)
+    p = info['parsed']
+    print(json.dumps(p, indent=2, ensure_ascii=False))
+    return p
 
 """if __name__ == "__main__":
     # Descomenta la siguiente línea para probarlo directamente ejecutando el archivo
@@ -8,6 +8,25 @@ from typing import Dict, Any, Optional, List
 # Configuración del logger
 logger = logging.getLogger(__name__)
 
+# Patrones precompilados (se aplican muchas veces por cada página WHOIS)
+_XOR_BLOCK_RE = re.compile(r'<(\w+)[^>]*data-xor-(?:email|text)="[^"]+"[^>]*>.*?</\1>', re.DOTALL)
+_XOR_PAYLOAD_RE = re.compile(r'data-xor-(?:email|text)="([^"]+)"')
+_XOR_KEY_RE = re.compile(r'data-xor-key="([^"]+)"')
+_MAILTO_RE = re.compile(r'href="mailto:([^"]+)"')
+_BR_RE = re.compile(r'<br\s*/?>')
+_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+_LEADING_PIPE_RE = re.compile(r'^\|\s*')
+_TRAILING_PIPE_RE = re.compile(r'\s*\|$')
+_DL_RE = re.compile(r'<dt[^>]*>(.*?)</dt>\s*<dd[^>]*>(.*?)</dd>', re.DOTALL | re.IGNORECASE)
+_LI_RE = re.compile(r'<li[^>]*>(.*?)</li>', re.DOTALL | re.IGNORECASE)
+_DISTANCE_LINE_RE = re.compile(r'<div class="distance-line"[^>]*>(.*?)</div>', re.DOTALL)
+_SECTION_RE = re.compile(r'<section[^>]*>(.*?)</section>', re.DOTALL | re.IGNORECASE)
+_H2_RE = re.compile(r'<h2[^>]*>(.*?)</h2>', re.DOTALL | re.IGNORECASE)
+_CARD_RE = re.compile(r'<div class="card[^"]*"[^>]*>(.*?)</div>\s*</div>', re.DOTALL | re.IGNORECASE)
+_CARD_HEADER_RE = re.compile(r'<div class="card-header"[^>]*>(.*?)</div>', re.DOTALL | re.IGNORECASE)
+_CARD_BODY_RE = re.compile(r'<div class="card-body"[^>]*>(.*?)</div>', re.DOTALL | re.IGNORECASE)
+
 # --- HELPERS DE DECODIFICACIÓN ---
 
 def decode_xor_email(encoded_email: str, key: str) -> str:
@@ -29,30 +48,28 @@ def clean_html_fragment(text: str) -> str:
     if not text: return ""
     
     # 1. BÚSQUEDA Y REEMPLAZO DE BLOQUES OFUSCADOS
-    xor_pattern = re.compile(r'<(\w+)[^>]*data-xor-(?:email|text)="[^"]+"[^>]*>.*?</\1>', re.DOTALL)
-    
     def replace_xor_block(match):
         block = match.group(0)
-        payload_m = re.search(r'data-xor-(?:email|text)="([^"]+)"', block)
-        key_m = re.search(r'data-xor-key="([^"]+)"', block)
+        payload_m = _XOR_PAYLOAD_RE.search(block)
+        key_m = _XOR_KEY_RE.search(block)
         
         if payload_m and key_m:
             decrypted = decode_xor_email(payload_m.group(1), key_m.group(2))
             if decrypted: return decrypted
         
-        mailto_m = re.search(r'href="mailto:([^"]+)"', block)
+        mailto_m = _MAILTO_RE.search(block)
         if mailto_m: return urllib.parse.unquote(mailto_m.group(1))
         return block
 
-    text = xor_pattern.sub(replace_xor_block, text)
+    text = _XOR_BLOCK_RE.sub(replace_xor_block, text)
     
     # 2. Limpieza estándar
-    text = re.sub(r'<br\s*/?>', ' | ', text)
-    text = re.sub(r'<[^>]+>', '', text)
+    text = _BR_RE.sub(' | ', text)
+    text = _TAG_RE.sub('', text)
     text = text.replace("&nbsp;", " ").replace("\t", " ").strip()
-    text = re.sub(r'\s+', ' ', text)
-    text = re.sub(r'^\|\s*', '', text)
-    text = re.sub(r'\s*\|$', '', text)
+    text = _WS_RE.sub(' ', text)
+    text = _LEADING_PIPE_RE.sub('', text)
+    text = _TRAILING_PIPE_RE.sub('', text)
     
     return text
 
@@ -65,8 +82,7 @@ def parse_generic_section(html_chunk: str) -> Any:
     section_data = {}
     
     # 1. Pares Clave-Valor
-    dl_pattern = re.compile(r'<dt[^>]*>(.*?)</dt>\s*<dd[^>]*>(.*?)</dd>', re.DOTALL | re.IGNORECASE)
-    pairs = dl_pattern.findall(html_chunk)
+    pairs = _DL_RE.findall(html_chunk)
     
     if pairs:
         for key_raw, val_raw in pairs:
@@ -86,8 +102,7 @@ def parse_generic_section(html_chunk: str) -> Any:
                 section_data[k] = v
                 
     # 2. Listas simples
-    li_pattern = re.compile(r'<li[^>]*>(.*?)</li>', re.DOTALL | re.IGNORECASE)
-    list_items = li_pattern.findall(html_chunk)
+    list_items = _LI_RE.findall(html_chunk)
     if list_items:
         clean_items = [clean_html_fragment(i) for i in list_items if clean_html_fragment(i)]
         if clean_items:
@@ -97,7 +112,7 @@ def parse_generic_section(html_chunk: str) -> Any:
                 return clean_items 
                 
     # 3. Dominios Similares
-    similar_rows = re.findall(r'<div class="distance-line"[^>]*>(.*?)</div>', html_chunk, re.DOTALL)
+    similar_rows = _DISTANCE_LINE_RE.findall(html_chunk)
     if similar_rows:
         section_data["similar_domains_list"] = [clean_html_fragment(row) for row in similar_rows]
 
@@ -132,25 +147,25 @@ def parse_full_page(html: str) -> Dict[str, Any]:
             flat_data[prefix] = parsed
 
     # PATRÓN 1: Etiquetas <section>
-    section_matches = re.finditer(r'<section[^>]*>(.*?)</section>', html, re.DOTALL | re.IGNORECASE)
+    section_matches = _SECTION_RE.finditer(html)
     for match in section_matches:
         content = match.group(1)
-        title_match = re.search(r'<h2[^>]*>(.*?)</h2>', content, re.DOTALL | re.IGNORECASE)
+        title_match = _H2_RE.search(content)
         title = title_match.group(1) if title_match else "Unlabeled_Section"
         process_content(title, content)
 
     # PATRÓN 2: Tarjetas laterales (<div class="card">)
-    card_matches = re.finditer(r'<div class="card[^"]*"[^>]*>(.*?)</div>\s*</div>', html, re.DOTALL | re.IGNORECASE)
+    card_matches = _CARD_RE.finditer(html)
     for match in card_matches:
         content = match.group(1)
-        header_match = re.search(r'<div class="card-header"[^>]*>(.*?)</div>', content, re.DOTALL | re.IGNORECASE)
+        header_match = _CARD_HEADER_RE.search(content)
         
         if header_match:
             title_raw = header_match.group(1)
-            h2_in_header = re.search(r'<h2[^>]*>(.*?)</h2>', title_raw, re.DOTALL | re.IGNORECASE)
+            h2_in_header = _H2_RE.search(title_raw)
             title = h2_in_header.group(1) if h2_in_header else title_raw
             
-            body_match = re.search(r'<div class="card-body"[^>]*>(.*?)</div>', content, re.DOTALL | re.IGNORECASE)
+            body_match = _CARD_BODY_RE.search(content)
             if body_match:
                 process_content(title, body_match.group(1))
 
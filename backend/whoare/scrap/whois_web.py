@@ -1,24 +1,54 @@
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from selectolax.lexbor import LexborHTMLParser as HTMLParser, LexborNode as Node
 from typing import Any, Dict, Optional
 
 WHOIS_URL = "https://www.whois.com/whois/{domain}"
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36"
+    )
+}
+
+# Cliente compartido entre peticiones (keep-alive + HTTP/2): evita un handshake TLS por dominio.
+# Se crea perezosamente dentro del event loop y se cierra en el lifespan de la app (aclose_client).
+_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        _CLIENT = httpx.AsyncClient(
+            http2=True,
+            headers=HEADERS,
+            timeout=15,
+            follow_redirects=True,
+        )
+    return _CLIENT
+
+
+async def aclose_client() -> None:
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
 
 
 # ----------------------------- helpers genéricos ----------------------------- #
 
+# Separadores que pasan a '_' en las claves
+_SLUG_TABLE = str.maketrans({ch: "_" for ch in " \t\n\r/-."})
+
 def _slugify(s: str) -> str:
     """
     Normaliza etiquetas a snake_case genérico:
       'Domain Name' -> 'domain_name'
       'Expires On'  -> 'expires_on'
     """
-    s = (s or "").strip().lower()
-    for ch in [" ", "\t", "\n", "\r", "/", "-", "."]:
-        s = s.replace(ch, "_")
-    while "__" in s:
-        s = s.replace("__", "_")
-    return s.strip("_")
+    s = (s or "").strip().lower().translate(_SLUG_TABLE)
+    # colapsa '__' repetidos y quita '_' de los extremos en una sola pasada
+    return "_".join(filter(None, s.split("_")))
 
 def _ua_section_prefix(line: str) -> Optional[str]:
     """
@@ -40,22 +70,27 @@ def _ua_section_prefix(line: str) -> Optional[str]:
 
     return None
 
-def _fetch_whois_html(domain: str) -> Optional[str]:
+def _stripped_strings(node: Node) -> list:
+    """
+    Equivalente a BeautifulSoup.stripped_strings: textos no vacíos del subárbol, en orden.
+    """
+    texts = []
+    for child in node.traverse(include_text=True):
+        if child.tag == "-text":
+            t = child.text(deep=False, strip=True)
+            if t:
+                texts.append(t)
+    return texts
+
+async def _fetch_whois_html(domain: str) -> Optional[str]:
     """
     Descarga el HTML de whois.com para el dominio dado.
     Devuelve el HTML como string o None si hay error / status != 200.
     """
     url = WHOIS_URL.format(domain=domain)
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/120.0.0.0 Safari/537.36"
-        )
-    }
     try:
-        resp = requests.get(url, headers=headers, timeout=15)
-    except requests.RequestException:
+        resp = await _get_client().get(url)
+    except httpx.HTTPError:
         return None
 
     if resp.status_code != 200:
@@ -65,31 +100,31 @@ def _fetch_whois_html(domain: str) -> Optional[str]:
 
 # ----------------------------- RAW Whois Data ----------------------------- #
 
-def _extract_raw_whois(soup: BeautifulSoup) -> Optional[str]:
+def _extract_raw_whois(tree: HTMLParser) -> Optional[str]:
     """
     Busca el bloque de 'Raw Whois Data' en el HTML y devuelve el texto del <pre>.
     No asume un único patrón, intenta varias variantes habituales.
     """
     # Caso típico: <pre id="registryData" class="df-raw">
-    pre = soup.find("pre", id="registryData")
+    pre = tree.css_first("pre#registryData")
     if pre:
-        return pre.get_text("\n", strip=True)
+        return "\n".join(_stripped_strings(pre))
 
     # Variante: cualquier <pre class="df-raw">
-    pre = soup.find("pre", class_="df-raw")
+    pre = tree.css_first("pre.df-raw")
     if pre:
-        return pre.get_text("\n", strip=True)
+        return "\n".join(_stripped_strings(pre))
 
     # Variante: df-block cuyo heading contenga "Raw Whois Data"
-    for block in soup.find_all("div", class_="df-block"):
-        heading = block.find("div", class_="df-heading")
+    for block in tree.css("div.df-block"):
+        heading = block.css_first("div.df-heading")
         if not heading:
             continue
-        title = heading.get_text(strip=True)
+        title = heading.text(strip=True)
         if "raw whois data" in title.lower():
-            pre = block.find("pre")
+            pre = block.css_first("pre")
             if pre:
-                return pre.get_text("\n", strip=True)
+                return "\n".join(_stripped_strings(pre))
 
     return None
 
@@ -193,7 +228,7 @@ def _whois_text_to_json_full_ua(whois_text: str) -> Dict[str, Any]:
 
 # ----------------------------- Bloques embellecidos ----------------------------- #
 
-def _parse_blocks_to_flat(soup: BeautifulSoup) -> Dict[str, Any]:
+def _parse_blocks_to_flat(tree: HTMLParser) -> Dict[str, Any]:
     """
     Parsea todos los bloques .df-block de la vista embellecida.
 
@@ -210,25 +245,25 @@ def _parse_blocks_to_flat(soup: BeautifulSoup) -> Dict[str, Any]:
     """
     flat: Dict[str, Any] = {}
 
-    blocks = soup.find_all("div", class_="df-block")
+    blocks = tree.css("div.df-block")
     for block in blocks:
-        heading_el = block.find("div", class_="df-heading")
-        heading_text = heading_el.get_text(strip=True) if heading_el else ""
+        heading_el = block.css_first("div.df-heading")
+        heading_text = heading_el.text(strip=True) if heading_el else ""
         section = _slugify(heading_text) or "section"
 
-        for row in block.find_all("div", class_="df-row"):
-            label_el = row.find("div", class_="df-label")
-            value_el = row.find("div", class_="df-value")
+        for row in block.css("div.df-row"):
+            label_el = row.css_first("div.df-label")
+            value_el = row.css_first("div.df-value")
             if not label_el or not value_el:
                 continue
 
-            label_raw = label_el.get_text(strip=True).rstrip(":")
+            label_raw = label_el.text(strip=True).rstrip(":")
             field = _slugify(label_raw) or "field"
 
             key = f"{section}__{field}"
 
             # Texto(s) del valor: si hay <br>, obtenemos varios
-            texts = list(value_el.stripped_strings)
+            texts = _stripped_strings(value_el)
             if not texts:
                 val: Any = None
             elif len(texts) == 1:
@@ -272,9 +307,9 @@ def parse_whois_html_to_json(html: str, domain: Optional[str] = None) -> Dict[st
           -> se suman TODAS las filas (sección__campo) sin filtrar
           -> se devuelve ese dict + meta '__source__' = 'blocks'
     """
-    soup = BeautifulSoup(html, "html.parser")
+    tree = HTMLParser(html)
 
-    raw_text = _extract_raw_whois(soup)
+    raw_text = _extract_raw_whois(tree)
     if raw_text:
         # --- Caso especial: .ua → prefijos por bloque (registrar_, registrant_, etc.)
         if domain and domain.lower().endswith(".ua"):
@@ -284,7 +319,7 @@ def parse_whois_html_to_json(html: str, domain: Optional[str] = None) -> Dict[st
         parsed["__source__"] = "raw"
         return parsed
 
-    flat = _parse_blocks_to_flat(soup)
+    flat = _parse_blocks_to_flat(tree)
     flat["__source__"] = "blocks"
     return flat
 
@@ -308,7 +343,7 @@ async def main(domain: str) -> Dict[str, Any]:
                        ...
                        + '__source__' = 'blocks'
     """
-    html = _fetch_whois_html(domain)
+    html = await _fetch_whois_html(domain)
     if not html:
         # En error, devolvemos dict vacío pero válido
         return {"__source__": "error", "__error__": "no_html"}
@@ -317,10 +352,11 @@ async def main(domain: str) -> Dict[str, Any]:
 
 
 """if __name__ == "__main__":
-    # Debug local rápido (síncrono)
+    # Debug local rápido
+    import asyncio
     import json
     dom = "kyivstar.ua"
-    html = _fetch_whois_html(dom)
+    html = asyncio.run(_fetch_whois_html(dom))
     if html:
         data = parse_whois_html_to_json(html, domain=dom)
         print(json.dumps(data, indent=2, ensure_ascii=False))
@@ -28,9 +28,9 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
-DATE_KEYS = {"creation_date", "expiration_date", "updated_date"}
+DATE_KEYS = frozenset({"creation_date", "expiration_date", "updated_date"})
 UA_MULTI_VALUE_TLD = "ua"
-UA_SENTINELS = {"n/a", "not published"}
+UA_SENTINELS = frozenset({"n/a", "not published"})
 
 # ... [Las funciones _ua_resolve_multi_source_field, _normalize_date, _normalize_value siguen igual] ...
 def _ua_resolve_multi_source_field(source_key: str, w: dict) -> Optional[str]:
@@ -45,16 +45,15 @@ def _ua_resolve_multi_source_field(source_key: str, w: dict) -> Optional[str]:
         if isinstance(v, (list, tuple, set)): collected.extend(v)
         else: collected.append(v)
     cleaned = []
-    seen = set()
     for v in collected:
         if v is None: continue
         if isinstance(v, datetime): v = v.isoformat()
         v_str = str(v).strip()
         if not v_str: continue
         if v_str.lower() in UA_SENTINELS: continue
-        if v_str in seen: continue
-        seen.add(v_str)
         cleaned.append(v_str)
+    # dedup preservando el orden de aparición
+    cleaned = list(dict.fromkeys(cleaned))
     return ", ".join(cleaned) if cleaned else None
 
 def _normalize_date(value, mode="first"):